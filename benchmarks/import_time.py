@@ -0,0 +1,93 @@
+"""
+Compare the cost of importing ``invitation.urls`` in the working tree
+against a baseline revision of the app, e.g. the revision before settings
+were made lazy and ``invitation.urls`` stopped importing the views::
+
+    DJANGO_SETTINGS_MODULE=settings python benchmarks/import_time.py \
+        --baseline 4a2140d^ --runs 20
+
+Run it from the repository with the settings of a project that has
+``invitation`` installed. The baseline ``invitation`` package is exported
+with ``git archive`` to a temporary directory imports are run from.
+
+Each import is measured in a fresh interpreter. For both trees the best
+time of the given number of runs is reported, with the number of modules
+imported in total and from the ``invitation`` package. ``invitation.urls``
+only imports ``app_settings`` and ``decorators`` from the app, models,
+forms, views and ``registration.views`` are imported on the first request
+instead.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from optparse import OptionParser
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TIMED = """
+import sys
+import time
+before = set(sys.modules)
+start = time.time()
+import invitation.urls
+elapsed = time.time() - start
+imported = [name for name in set(sys.modules) - before
+            if sys.modules[name] is not None]
+print elapsed, len(imported), len([name for name in imported
+                                   if name.startswith('invitation.')])
+"""
+
+
+def export(revision):
+    """Export ``invitation`` package at ``revision`` to a temporary directory.
+    """
+    path = tempfile.mkdtemp(prefix='invitation-baseline-')
+    archive = subprocess.Popen(['git', 'archive', revision, 'invitation'],
+                               cwd=ROOT, stdout=subprocess.PIPE)
+    subprocess.check_call(['tar', '-x', '-C', path], stdin=archive.stdout)
+    if archive.wait():
+        shutil.rmtree(path)
+        raise SystemExit('Can\'t export revision %s' % revision)
+    return path
+
+
+def best_of(path, runs):
+    env = dict(os.environ)
+    # Run from ``path``, the current directory comes first on sys.path,
+    # and keep it importable for the settings module
+    env['PYTHONPATH'] = os.pathsep.join(
+                            [path, os.getcwd()] +
+                            filter(None, [env.get('PYTHONPATH')]))
+    results = []
+    for i in range(runs):
+        output = subprocess.Popen([sys.executable, '-c', TIMED],
+                                  cwd=path, env=env,
+                                  stdout=subprocess.PIPE).communicate()[0]
+        elapsed, modules, app_modules = output.strip().splitlines()[-1].split()
+        results.append((float(elapsed), int(modules), int(app_modules)))
+    return min(results)
+
+
+def report(label, result):
+    print '%-9s %7.1f ms %5d modules %3d invitation modules' % (
+              label, result[0] * 1000, result[1], result[2])
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage='%prog --baseline REVISION [--runs N]')
+    parser.add_option('--baseline',
+                      help='git revision to compare the working tree with')
+    parser.add_option('--runs', type='int', default=10,
+                      help='number of imports to take the best of')
+    options, args = parser.parse_args()
+    if not options.baseline:
+        parser.error('--baseline is required')
+    baseline_path = export(options.baseline)
+    try:
+        report('baseline', best_of(baseline_path, options.runs))
+        report('current', best_of(ROOT, options.runs))
+    finally:
+        shutil.rmtree(baseline_path)
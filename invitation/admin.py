@@ -4,11 +4,13 @@ from models import Invitation, InvitationStats
 
 class InvitationAdmin(admin.ModelAdmin):
     list_display = ('user', 'email', 'expiration_date')
+    list_select_related = True
 admin.site.register(Invitation, InvitationAdmin)
 
 
 class InvitationStatsAdmin(admin.ModelAdmin):
-    list_display = ('user', 'available', 'sent', 'accepted', 'performance')
+    list_display = ('user', 'available', 'sent', 'accepted', 'flagged',
+                    'performance')
 
     def performance(self, obj):
         return '%0.2f' % obj.performance
@@ -0,0 +1,184 @@
+"""
+JSON endpoints for invitation and registration.
+
+Responses are serialized directly, no templates are rendered. ``invite``
+requires an authenticated session and is CSRF protected like any other
+view, clients should send the CSRF token in ``X-CSRFToken`` header.
+"""
+import datetime
+from django import forms
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import simplejson
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from registration.signals import user_registered
+from invitation import app_settings
+from invitation.domains import validate_domains
+from invitation.fraud import get_ip
+from invitation.models import InvitationError, Invitation
+from invitation.models import normalize_email
+from invitation.forms import RegistrationFormInvitation
+from invitation.views import accept_invitation
+
+
+def json_response(data, status=200):
+    response = HttpResponse(simplejson.dumps(data, cls=DjangoJSONEncoder),
+                            mimetype='application/json')
+    response.status_code = status
+    return response
+
+
+def load_json(request):
+    """
+    Return the JSON object in request body, ``None`` if the body is not a
+    JSON object.
+    """
+    try:
+        data = simplejson.loads(request.raw_post_data)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    return data
+
+
+@transaction.commit_on_success
+def invite_many(user, emails, ip=None):
+    return Invitation.objects.invite_many(user, emails, ip)
+
+
+@require_POST
+def invite(request):
+    """
+    Invite a list of email addresses and send invitation emails.
+
+    Request body must be a JSON object with an ``emails`` key holding a
+    list of addresses. Invitations are used from the user's stats once for
+    the whole list; if there aren't enough available invitations none is
+    created and the response status is ``403``.
+
+    Response is an object with a ``results`` key holding a list of
+    ``{"email": ..., "status": ...}`` objects in the order of ``emails``.
+    Status is one of:
+
+    :invited: A new invitation is created and sent.
+    :existing: There is already an outstanding invitation.
+    :duplicate: Address is a duplicate of a previous address in the list,
+                after normalization if ``INVITATION_GLOBAL_DEDUP`` is
+                ``True``. Only the first occurrence is invited.
+    :suppressed: Invitations to the address are suppressed, e.g. because
+                 a previous invitation bounced.
+    :invalid: Address is not a valid email address, or its domain can't
+              receive email if ``INVITATION_VALIDATE_DOMAINS`` is ``True``.
+    """
+    if not request.user.is_authenticated():
+        return json_response({'error': 'authentication required'}, 401)
+    data = load_json(request)
+    emails = data and data.get('emails')
+    if not isinstance(emails, list) or \
+       not all(isinstance(email, basestring) for email in emails):
+        return json_response({'error': 'emails list required'}, 400)
+    if app_settings.GLOBAL_DEDUP:
+        identity = normalize_email
+    else:
+        identity = lambda email: email
+    field = forms.EmailField()
+    # [email, status] pairs in the order of emails, status is None for
+    # addresses to invite
+    results, seen = [], set()
+    for email in emails:
+        try:
+            email = field.clean(email)
+        except forms.ValidationError:
+            results.append([email, 'invalid'])
+            continue
+        if identity(email) in seen:
+            results.append([email, 'duplicate'])
+        else:
+            seen.add(identity(email))
+            results.append([email, None])
+    if app_settings.VALIDATE_DOMAINS:
+        valid_domains = validate_domains(email.rsplit('@', 1)[1]
+                                         for email, status in results
+                                         if status is None)
+        for result in results:
+            if result[1] is None and \
+               not valid_domains[result[0].rsplit('@', 1)[1].lower()]:
+                result[1] = 'invalid'
+    try:
+        invitations = invite_many(request.user,
+                                  [email for email, status in results
+                                   if status is None],
+                                  get_ip(request))
+    except InvitationError:
+        return json_response({'error': 'no available invitations'}, 403)
+    statuses, to_send = {}, []
+    for email, invitation, created in invitations:
+        if invitation is None:
+            statuses[email] = 'suppressed'
+            continue
+        # Outstanding invitations of other users are not mailed again,
+        # see INVITATION_GLOBAL_DEDUP.
+        if invitation.user_id == request.user.id:
+            to_send.append(invitation)
+        statuses[email] = created and 'invited' or 'existing'
+    # All emails are sent over a single connection
+    Invitation.objects.send_emails(to_send, request=request)
+    results = [{'email': email, 'status': status or statuses[email]}
+               for email, status in results]
+    return json_response({'results': results})
+
+
+@require_GET
+def key(request, invitation_key):
+    """
+    Check if an invitation key is valid.
+
+    Response is ``{"valid": true, "email": ..., "expiration_date": ...}``
+    for a valid key and ``{"valid": false}`` with status ``404`` otherwise.
+    Answers are served from cache when possible, see
+    ``InvitationManager.lookup()``.
+    """
+    data = Invitation.objects.lookup(invitation_key)
+    if data is None:
+        return json_response({'valid': False}, 404)
+    expiration_date = (data['date_invited'] +
+                       datetime.timedelta(app_settings.EXPIRE_DAYS)).date()
+    return json_response({'valid': True,
+                          'email': data['email'],
+                          'expiration_date': expiration_date})
+
+
+@csrf_exempt
+@require_POST
+def accept(request, invitation_key):
+    """
+    Register a new user via invitation.
+
+    Request body must be a JSON object with ``username``, ``password1`` and
+    ``password2`` keys. The new user's email is always the invited email.
+
+    Responds with status ``201`` and ``{"username": ...}`` on success,
+    ``400`` and ``{"errors": {...}}`` if the data is not valid and ``404``
+    if the invitation key is not valid.
+    """
+    data = load_json(request)
+    if data is None:
+        return json_response({'error': 'JSON object required'}, 400)
+    try:
+        invitation = Invitation.objects.find(invitation_key)
+    except Invitation.DoesNotExist:
+        return json_response({'error': 'invalid invitation key'}, 404)
+    form = RegistrationFormInvitation(invitation.email, data)
+    if not form.is_valid():
+        errors = dict((field, [unicode(e) for e in field_errors])
+                      for field, field_errors in form.errors.items())
+        return json_response({'errors': errors}, 400)
+    try:
+        new_user = accept_invitation(invitation, form, request)
+    except InvitationError:
+        return json_response({'error': 'invalid invitation key'}, 404)
+    user_registered.send(sender="invitation", user=new_user, request=request)
+    return json_response({'username': new_user.username}, 201)
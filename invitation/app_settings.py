@@ -1,8 +1,48 @@
+"""
+Settings of ``invitation`` app.
+
+Settings are read from ``django.conf.settings`` with ``INVITATION_``
+prefix the first time they are accessed, not when this module is imported,
+and cached afterwards. This module is replaced with an ``AppSettings``
+instance in ``sys.modules``, so ``app_settings.INVITE_ONLY`` works as a
+plain module attribute would.
+"""
+import sys
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.utils.importlib import import_module
 
 
+DEFAULTS = {
+    'INVITE_ONLY': False,
+    'EXPIRE_DAYS': 15,
+    'INITIAL_INVITATIONS': 10,
+    'REWARD_THRESHOLD': 0.75,
+    'PERFORMANCE_FUNC': None,
+    'GLOBAL_DEDUP': False,
+    'DEDUP_STRIP_PLUS_TAG': False,
+    'DASHBOARD_TTL': 86400,
+    'LOOKUP_CACHE_TTL': 300,
+    'SERVICE_WORKERS': 4,
+    'EMAIL_BACKEND': None,
+    'READ_DATABASE': None,
+    'WRITE_DATABASE': 'default',
+    'PIN_SECONDS': 15,
+    'ARCHIVE_DAYS': 90,
+    'QUOTA_WINDOWS': (),
+    'VALIDATE_DOMAINS': False,
+    'DOMAIN_RESOLVER': 'invitation.domains.DNSResolver',
+    'DOMAIN_CACHE_TTL': 86400,
+    'DOMAIN_NEGATIVE_CACHE_TTL': 3600,
+    'REGISTRATION_FORM_CACHE_TTL': 0,
+    'STATIC_PAGE_MAX_AGE': 300,
+    'FRAUD_CHECKS': (),
+    'FRAUD_BURST_LIMIT': 10,
+    'FRAUD_BURST_WINDOW': 3600,
+    'DISPOSABLE_DOMAINS': (),
+}
+
+
 def get_performance_func(settings):
     performance_func = getattr(settings, 'INVITATION_PERFORMANCE_FUNC', None)
     if isinstance(performance_func, (str, unicode)):
@@ -17,10 +57,39 @@ def get_performance_func(settings):
         raise ImproperlyConfigured('INVITATION_PERFORMANCE_FUNC must be a ' \
                                    'callable or an import path string ' \
                                    'pointing to a callable.')
+    return performance_func
+
+
+class AppSettings(object):
+    """
+    Lazily evaluated ``invitation`` settings.
+
+    Assigning an attribute overrides the setting until ``reset()`` is
+    called.
+    """
+    def __init__(self, module):
+        # Globals of this module are cleared if it is garbage collected
+        self._module = module
+
+    def __getattr__(self, name):
+        if name not in DEFAULTS:
+            raise AttributeError(name)
+        if name == 'PERFORMANCE_FUNC':
+            value = get_performance_func(settings)
+        else:
+            value = getattr(settings, 'INVITATION_' + name, DEFAULTS[name])
+        setattr(self, name, value)
+        return value
+
+    def reset(self):
+        """
+        Forget cached and overridden settings.
+        """
+        for name in DEFAULTS:
+            self.__dict__.pop(name, None)
+
+
+app_settings = AppSettings(sys.modules[__name__])
 
 
-INVITE_ONLY = getattr(settings, 'INVITATION_INVITE_ONLY', False)
-EXPIRE_DAYS = getattr(settings, 'INVITATION_EXPIRE_DAYS', 15)
-INITIAL_INVITATIONS = getattr(settings, 'INVITATION_INITIAL_INVITATIONS', 10)
-REWARD_THRESHOLD = getattr(settings, 'INVITATION_REWARD_THRESHOLD', 0.75)
-PERFORMANCE_FUNC = get_performance_func(settings)
+sys.modules[__name__] = app_settings
@@ -0,0 +1,52 @@
+"""
+Store archived invitations in a JSON Lines file instead of the archive
+table. Files with ``.gz`` extension are gzip compressed.
+"""
+import datetime
+import gzip
+from django.utils import simplejson
+
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def open_file(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+class JSONLinesArchive(object):
+    """
+    An archive of invitations in file at ``path``, one JSON object per
+    line. New rows are appended to the file.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def store(self, rows):
+        f = open_file(self.path, 'ab')
+        try:
+            for row in rows:
+                row = dict(row)
+                row['date_invited'] = row['date_invited'].strftime(
+                                                                  DATE_FORMAT)
+                f.write(simplejson.dumps(row) + '\n')
+        finally:
+            f.close()
+
+    def __iter__(self):
+        f = open_file(self.path, 'rb')
+        try:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = dict((str(k), v)
+                           for k, v in simplejson.loads(line).items())
+                row['date_invited'] = datetime.datetime.strptime(
+                                             row['date_invited'], DATE_FORMAT)
+                # Files written before bounces were archived
+                row.setdefault('bounced', False)
+                yield row
+        finally:
+            f.close()
@@ -0,0 +1,83 @@
+"""
+Read bounced addresses from bounce reports and update invitations.
+"""
+import itertools
+import mailbox
+from django.db import transaction
+from django.utils import simplejson
+from invitation.models import Invitation, SuppressedEmail
+
+
+def addresses_from_json(path):
+    """
+    Yield addresses in a JSON file holding a list of addresses or a list of
+    objects with an ``email`` key.
+    """
+    f = open(path, 'rb')
+    try:
+        data = simplejson.load(f)
+    finally:
+        f.close()
+    for item in data:
+        if isinstance(item, dict):
+            item = item.get('email')
+        if item:
+            yield item
+
+
+def bounced_addresses(message):
+    """
+    Yield failed recipients of a bounce ``message``, read from
+    ``X-Failed-Recipients`` headers and delivery status notifications.
+    """
+    for header in message.get_all('X-Failed-Recipients') or []:
+        for address in header.split(','):
+            if address.strip():
+                yield address.strip()
+    for part in message.walk():
+        if part.get_content_type() != 'message/delivery-status':
+            continue
+        for block in part.get_payload():
+            if block.get('Action', '').strip().lower() != 'failed':
+                continue
+            recipient = block.get('Final-Recipient', '')
+            address = recipient.split(';', 1)[-1].strip()
+            if address:
+                yield address
+
+
+def addresses_from_maildir(path):
+    """
+    Yield failed recipients of all bounce messages in maildir at ``path``.
+    """
+    for message in mailbox.Maildir(path, factory=None):
+        for address in bounced_addresses(message):
+            yield address
+
+
+@transaction.commit_on_success
+def process_bounces(emails, reason='bounce'):
+    """
+    Mark invitations to ``emails`` bounced and suppress further
+    invitations to them. Return a ``(bounced, suppressed)`` tuple of the
+    number of invitations marked bounced and addresses newly suppressed.
+    """
+    emails = list(emails)
+    return (Invitation.objects.mark_bounced(emails),
+            SuppressedEmail.objects.suppress(emails, reason))
+
+
+def ingest(emails, batch_size=1000, reason='bounce'):
+    """
+    Process ``emails`` in batches of ``batch_size``, each in its own
+    transaction. Return totals like ``process_bounces()``.
+    """
+    emails = iter(emails)
+    bounced = suppressed = 0
+    while True:
+        batch = list(itertools.islice(emails, batch_size))
+        if not batch:
+            return bounced, suppressed
+        b, s = process_bounces(batch, reason)
+        bounced += b
+        suppressed += s
@@ -0,0 +1,86 @@
+import datetime
+from django.core.cache import cache
+from django.db import models
+from django.contrib.auth.models import User
+from invitation import app_settings
+from invitation.models import Invitation, InvitationStats, InvitationRollup
+from invitation.snapshot import StatsSnapshot
+
+
+CACHE_KEY = 'invitation.dashboard'
+
+
+def build_dashboard(days=30, top=10, expiring_days=2):
+    """
+    Calculate invitation dashboard figures.
+
+    This function runs aggregate queries over whole tables, use
+    ``refresh_dashboard()`` to cache the figures and ``get_dashboard()``
+    to read them.
+
+    **Optional arguments:**
+
+    :days:
+        Number of days, ending today, included in daily figures. Daily
+        figures are read from ``InvitationRollup``. Default is ``30``.
+
+    :top:
+        Number of inviters with highest performance to include. Default
+        is ``10``.
+
+    :expiring_days:
+        Invitations expiring in this many days are counted as expiring
+        soon. Default is ``2``.
+    """
+    now = datetime.datetime.now()
+    totals = InvitationStats.objects.aggregate(
+                                        available=models.Sum('available'),
+                                        sent=models.Sum('sent'),
+                                        accepted=models.Sum('accepted'))
+    for key, value in totals.items():
+        totals[key] = value or 0
+    if totals['sent']:
+        totals['conversion'] = float(totals['accepted']) / totals['sent']
+    else:
+        totals['conversion'] = 0.0
+    since = now.date() - datetime.timedelta(days - 1)
+    daily = list(InvitationRollup.objects.filter(date__gte=since) \
+                                         .order_by('date') \
+                                         .values('date') \
+                                         .annotate(sent=models.Sum('sent'),
+                                             accepted=models.Sum('accepted')))
+    best = StatsSnapshot.load().top(top)
+    usernames = dict(User.objects.filter(pk__in=[u for p, u in best]) \
+                                 .values_list('pk', 'username'))
+    top_inviters = [{'username': usernames.get(user_id),
+                     'performance': float(performance)}
+                    for performance, user_id in best]
+    expiring_after = now - datetime.timedelta(app_settings.EXPIRE_DAYS)
+    expiring_before = expiring_after + datetime.timedelta(expiring_days)
+    expiring_soon = Invitation.objects.filter(
+                                    date_invited__gte=expiring_after,
+                                    date_invited__lt=expiring_before).count()
+    return {'totals': totals,
+            'daily': daily,
+            'top_inviters': top_inviters,
+            'expiring_soon': expiring_soon,
+            'expiring_days': expiring_days,
+            'generated_at': now}
+
+
+def get_dashboard():
+    """
+    Return cached dashboard figures, ``None`` if they are not calculated
+    yet. Figures are never calculated here, see ``refresh_dashboard()``.
+    """
+    return cache.get(CACHE_KEY)
+
+
+def refresh_dashboard():
+    """
+    Calculate dashboard figures and cache them for
+    ``INVITATION_DASHBOARD_TTL`` seconds. Return the figures.
+    """
+    dashboard = build_dashboard()
+    cache.set(CACHE_KEY, dashboard, app_settings.DASHBOARD_TTL)
+    return dashboard
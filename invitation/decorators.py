@@ -0,0 +1,45 @@
+"""
+View decorators used by ``invitation.urls``. This module must stay cheap to
+import, it doesn't import models, forms or other views.
+"""
+from django.http import Http404, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.functional import wraps
+from django.utils.hashcompat import md5_constructor
+import app_settings
+
+
+def cached_page(view_func):
+    """
+    Add ``ETag`` and ``Cache-Control`` headers to successful responses of
+    ``view_func`` and respond with ``304 Not Modified`` if the client
+    already has the same content.
+
+    Responses may be cached by the client for
+    ``INVITATION_STATIC_PAGE_MAX_AGE`` seconds.
+    """
+    def _wrapped_view(request, *args, **kwargs):
+        response = view_func(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        etag = '"%s"' % md5_constructor(response.content).hexdigest()
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = HttpResponseNotModified()
+        response['ETag'] = etag
+        patch_cache_control(response,
+                            private=True,
+                            max_age=app_settings.STATIC_PAGE_MAX_AGE)
+        return response
+    return wraps(view_func)(_wrapped_view)
+
+
+def invite_only_required(view_func):
+    """
+    Respond with ``404 Not Found`` unless ``INVITATION_INVITE_ONLY`` is
+    ``True``. The setting is checked on each request.
+    """
+    def _wrapped_view(request, *args, **kwargs):
+        if not app_settings.INVITE_ONLY:
+            raise Http404
+        return view_func(request, *args, **kwargs)
+    return wraps(view_func)(_wrapped_view)
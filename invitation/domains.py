@@ -0,0 +1,134 @@
+"""
+Check that email domains can receive email before inviting them.
+
+A domain is valid if it has an MX or an A record. Lookups are done by the
+resolver class given in ``INVITATION_DOMAIN_RESOLVER`` setting and their
+results are cached, valid domains for ``INVITATION_DOMAIN_CACHE_TTL``
+seconds and invalid domains for ``INVITATION_DOMAIN_NEGATIVE_CACHE_TTL``
+seconds.
+
+A resolver is a class with a ``resolve(domain)`` method that returns
+``True`` or ``False``, or ``None`` if the lookup failed for another reason,
+e.g. a timeout. Domains that can't be resolved are considered valid and
+are not cached.
+"""
+import socket
+from multiprocessing.pool import ThreadPool
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.hashcompat import md5_constructor
+from django.utils.importlib import import_module
+from invitation import app_settings
+try:
+    import dns.exception
+    import dns.resolver
+except ImportError:
+    dns = None
+
+
+class DNSResolver(object):
+    """
+    Look up MX and A records with ``dnspython`` if it is installed, look up
+    only A records with ``socket`` otherwise.
+    """
+    def resolve(self, domain):
+        if dns is None:
+            try:
+                socket.gethostbyname(domain)
+            except socket.gaierror, e:
+                if e.args[0] in (socket.EAI_NONAME,
+                                 getattr(socket, 'EAI_NODATA', None)):
+                    return False
+                return None
+            except socket.error:
+                return None
+            return True
+        for record_type in ('MX', 'A'):
+            try:
+                dns.resolver.query(domain, record_type)
+            except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+                continue
+            except dns.exception.DNSException:
+                return None
+            return True
+        return False
+
+
+class StubResolver(object):
+    """
+    Resolve only the given ``domains``, for tests.
+    """
+    def __init__(self, domains=()):
+        self.domains = set(domains)
+
+    def resolve(self, domain):
+        return domain in self.domains
+
+
+def get_resolver():
+    path = app_settings.DOMAIN_RESOLVER
+    module_name, class_name = path.rsplit('.', 1)
+    try:
+        return getattr(import_module(module_name), class_name)()
+    except (ImportError, AttributeError):
+        raise ImproperlyConfigured('Can\'t import domain resolver `%s` ' \
+                                   'from `%s`' % (class_name, module_name))
+
+
+def cache_key(domain):
+    digest = md5_constructor(domain.encode('utf-8')).hexdigest()
+    return 'invitation.domain.%s' % digest
+
+
+def resolve_and_cache(domain, resolver):
+    valid = resolver.resolve(domain)
+    if valid is None:
+        return True
+    if valid:
+        timeout = app_settings.DOMAIN_CACHE_TTL
+    else:
+        timeout = app_settings.DOMAIN_NEGATIVE_CACHE_TTL
+    cache.set(cache_key(domain), valid, timeout)
+    return valid
+
+
+def is_valid_domain(domain, resolver=None):
+    """
+    Return ``True`` if ``domain`` can receive email.
+    """
+    domain = domain.lower()
+    valid = cache.get(cache_key(domain))
+    if valid is None:
+        valid = resolve_and_cache(domain, resolver or get_resolver())
+    return valid
+
+
+def validate_domains(domains, resolver=None, workers=8):
+    """
+    Return a dictionary mapping each of ``domains`` to ``True`` if it can
+    receive email, ``False`` otherwise.
+
+    Domains that are not cached are resolved concurrently in ``workers``
+    threads.
+    """
+    domains = set(domain.lower() for domain in domains)
+    cached = cache.get_many([cache_key(domain) for domain in domains])
+    result, missing = {}, []
+    for domain in domains:
+        valid = cached.get(cache_key(domain))
+        if valid is None:
+            missing.append(domain)
+        else:
+            result[domain] = valid
+    if missing:
+        resolver = resolver or get_resolver()
+        pool = ThreadPool(min(workers, len(missing)))
+        try:
+            resolved = pool.map(lambda domain: resolve_and_cache(domain,
+                                                                 resolver),
+                                missing)
+        finally:
+            pool.close()
+            pool.join()
+        result.update(zip(missing, resolved))
+    return result
@@ -1,6 +1,9 @@
 from django import forms
+from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.models import User
 from registration.forms import RegistrationForm
+from invitation import app_settings
+from invitation.domains import is_valid_domain
 
 
 def save_user(form_instance):
@@ -22,6 +25,18 @@ def save_user(form_instance):
 class InvitationForm(forms.Form):
     email = forms.EmailField()
 
+    def clean_email(self):
+        """
+        Check that email's domain can receive email if
+        ``INVITATION_VALIDATE_DOMAINS`` is ``True``.
+        """
+        email = self.cleaned_data['email']
+        if app_settings.VALIDATE_DOMAINS and \
+           not is_valid_domain(email.rsplit('@', 1)[1]):
+            raise forms.ValidationError(_(u'This email address\'s domain ' \
+                                          u'can\'t receive email.'))
+        return email
+
 
 class RegistrationFormInvitation(RegistrationForm):
     """
@@ -38,7 +53,9 @@ class RegistrationFormInvitation(RegistrationForm):
 
     def _make_email_immutable(self, email):
         self._email = self.initial['email'] = email
-        if 'email' in self.data:
+        if self.is_bound:
+            # Set even if missing, required field check runs before
+            # clean_email
             self.data = self.data.copy()
             self.data['email'] = email
         self.fields['email'].widget.attrs.update({'readonly': True})
@@ -0,0 +1,99 @@
+"""
+Cheap checks run when an invitation is accepted to flag suspect
+acceptances, e.g. inviters accepting their own invitations to boost their
+performance.
+
+Checks are callables listed by import path in ``INVITATION_FRAUD_CHECKS``
+setting. A check is called with the accepted ``Invitation``, the new user
+and the request, which may be ``None``, and returns a short reason string
+if the acceptance is suspect, ``None`` otherwise. Checks must not scan
+tables, per-inviter counters are kept in the cache.
+
+Suspect acceptances are recorded in ``InvitationAcceptance.suspect`` and
+counted in ``InvitationStats.flagged``, which is excluded from the
+performance calculations.
+"""
+import time
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.importlib import import_module
+from invitation import app_settings
+
+
+MAX_IP_LENGTH = 45
+
+
+def get_ip(request):
+    """
+    Return the client address of ``request``, IPv4 or IPv6, ``None`` if
+    there is no request. Longer values are cut to fit
+    ``Invitation.inviter_ip``.
+    """
+    if request is None:
+        return None
+    return request.META.get('REMOTE_ADDR', '')[:MAX_IP_LENGTH] or None
+
+
+def same_ip(invitation, new_user, request):
+    """Flag acceptances from the address the invitation was sent from.
+    """
+    ip = get_ip(request)
+    if ip and ip == invitation.inviter_ip:
+        return 'same_ip'
+
+
+def burst_cache_key(user_id, window):
+    return 'invitation.fraud.burst.%d.%d' % (user_id,
+                                             int(time.time()) // window)
+
+
+def burst(invitation, new_user, request):
+    """
+    Flag acceptances of an inviter above ``INVITATION_FRAUD_BURST_LIMIT``
+    in a window of ``INVITATION_FRAUD_BURST_WINDOW`` seconds.
+    """
+    window = app_settings.FRAUD_BURST_WINDOW
+    key = burst_cache_key(invitation.user_id, window)
+    cache.add(key, 0, window)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # Evicted between add and incr
+        cache.set(key, 1, window)
+        count = 1
+    if count > app_settings.FRAUD_BURST_LIMIT:
+        return 'burst'
+
+
+def disposable_domain(invitation, new_user, request):
+    """Flag acceptances to domains in ``INVITATION_DISPOSABLE_DOMAINS``.
+    """
+    domain = invitation.email.rsplit('@', 1)[-1].lower()
+    if domain in app_settings.DISPOSABLE_DOMAINS:
+        return 'disposable_domain'
+
+
+def get_checks():
+    checks = []
+    for path in app_settings.FRAUD_CHECKS:
+        module_name, func_name = path.rsplit('.', 1)
+        try:
+            checks.append(getattr(import_module(module_name), func_name))
+        except (ImportError, AttributeError):
+            raise ImproperlyConfigured('Can\'t import fraud check `%s` ' \
+                                       'from `%s`' % (func_name,
+                                                      module_name))
+    return checks
+
+
+def check(invitation, new_user, request=None):
+    """
+    Run ``INVITATION_FRAUD_CHECKS`` and return the list of reasons the
+    acceptance is suspect, an empty list if it is not.
+    """
+    reasons = []
+    for check_func in get_checks():
+        reason = check_func(invitation, new_user, request)
+        if reason:
+            reasons.append(reason)
+    return reasons
@@ -0,0 +1,38 @@
+import datetime
+from optparse import make_option
+from django.core.management.base import CommandError, NoArgsCommand
+from invitation import app_settings
+from invitation.archive import JSONLinesArchive
+from invitation.models import Invitation
+
+
+class Command(NoArgsCommand):
+    help = 'Move old invitations to the archive table or a file.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--days', dest='days', type='int', default=None,
+                    help='Archive invitations older than this many days. ' \
+                         'Default is INVITATION_ARCHIVE_DAYS setting.'),
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=1000,
+                    help='Number of invitations moved in each transaction.'),
+        make_option('--file', dest='file', default=None,
+                    help='Append archived invitations to this JSON Lines ' \
+                         'file instead of the archive table. Use .gz ' \
+                         'extension to compress it.'),
+    )
+
+    def handle_noargs(self, **options):
+        days = options['days'] or app_settings.ARCHIVE_DAYS
+        if days < app_settings.EXPIRE_DAYS:
+            raise CommandError('Can\'t archive invitations that are not ' \
+                               'expired yet, use at least %s days.' % \
+                                                     app_settings.EXPIRE_DAYS)
+        before = datetime.datetime.now() - datetime.timedelta(days)
+        store = None
+        if options['file']:
+            store = JSONLinesArchive(options['file']).store
+        count = Invitation.objects.archive(before,
+                                           options['batch_size'],
+                                           store)
+        if int(options.get('verbosity', 1)) > 0:
+            print "Archived %s invitations" % count
@@ -0,0 +1,13 @@
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from invitation.models import InviteTreeNode
+
+
+class Command(NoArgsCommand):
+    help = 'Build the invite tree from the invitation acceptance log.'
+
+    @transaction.commit_on_success
+    def handle_noargs(self, **options):
+        count = InviteTreeNode.objects.rebuild()
+        if int(options.get('verbosity', 1)) > 0:
+            print "%s nodes created" % count
@@ -0,0 +1,34 @@
+import os
+from optparse import make_option
+from django.core.management.base import CommandError, LabelCommand
+from invitation.bounces import addresses_from_json, addresses_from_maildir
+from invitation.bounces import ingest
+
+
+class Command(LabelCommand):
+    help = 'Mark bounced invitations and suppress further invitations ' \
+           'to bounced addresses.'
+    args = '<maildir or JSON file> ...'
+    label = 'maildir or JSON file'
+    option_list = LabelCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=1000,
+                    help='Number of addresses processed in each ' \
+                         'transaction.'),
+        make_option('--reason', dest='reason', default='bounce',
+                    help='Reason recorded for suppressed addresses.'),
+    )
+
+    def handle_label(self, path, **options):
+        if os.path.isdir(path):
+            emails = addresses_from_maildir(path)
+        elif os.path.isfile(path):
+            emails = addresses_from_json(path)
+        else:
+            raise CommandError('%s is not a maildir or a file.' % path)
+        bounced, suppressed = ingest(emails,
+                                     options['batch_size'],
+                                     options['reason'])
+        if int(options.get('verbosity', 1)) > 0:
+            print "%s: %s invitations bounced, %s addresses suppressed" % (
+                                                   path, bounced, suppressed)
@@ -0,0 +1,241 @@
+"""
+Drive concurrent invitations and acceptances through the views and check
+that invitation stats stay consistent.
+
+The command writes to the configured database; users and invitations it
+creates are prefixed with ``loadtest`` and removed at the end unless
+``--keep`` is given. ``invitation.urls`` must be included in the
+project's URLconf. SQLite databases must be file based, worker processes
+can't share an in-memory database.
+
+On PostgreSQL the time backends spend waiting on locks is sampled from
+``pg_locks`` while the workers run. Other databases don't expose lock
+waits, only requests that fail on a lock (e.g. ``database is locked`` on
+SQLite) and the time spent in them are reported.
+"""
+import threading
+import time
+from multiprocessing import Pool
+from optparse import make_option
+from django.conf import settings
+from django.core.management.base import NoArgsCommand
+from django.core.urlresolvers import reverse
+from django.db import DatabaseError, close_connection, connection
+from django.test.client import Client
+from django.contrib.auth.models import User
+from invitation import app_settings
+from invitation.models import Invitation, InvitationStats
+
+
+PREFIX = 'loadtest'
+INVITER = '%s-inviter' % PREFIX
+PASSWORD = 'loadtest'
+
+
+def wait_until(start_at):
+    delay = start_at - time.time()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def timed(func, *args, **kwargs):
+    """
+    Return ``(result, seconds, error)`` of calling ``func``.
+    """
+    started = time.time()
+    try:
+        return func(*args, **kwargs), time.time() - started, None
+    except DatabaseError, e:
+        return None, time.time() - started, e
+
+
+def invite_worker(args):
+    worker, count, start_at = args
+    settings.EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+    client = Client()
+    client.login(username=INVITER, password=PASSWORD)
+    url = reverse('invitation_invite')
+    results = []
+    wait_until(start_at)
+    for i in range(count):
+        email = '%s-%s-%s@example.com' % (PREFIX, worker, i)
+        response, seconds, error = timed(client.post, url, {'email': email})
+        invited = response is not None and response.status_code == 302 and \
+                  response['Location'].endswith(reverse('invitation_complete'))
+        results.append((invited, seconds, error and str(error)))
+    close_connection()
+    return results
+
+
+def accept_worker(args):
+    worker, invitation_key, start_at = args
+    client = Client()
+    url = reverse('invitation_register', args=(invitation_key,))
+    username = '%s-invitee-%s' % (PREFIX, worker)
+    data = {'username': username,
+            'email': '%s@example.com' % username,
+            'password1': PASSWORD,
+            'password2': PASSWORD}
+    wait_until(start_at)
+    response, seconds, error = timed(client.post, url, data)
+    accepted = response is not None and response.status_code == 302
+    close_connection()
+    return accepted, seconds, error and str(error)
+
+
+class LockWaitSampler(threading.Thread):
+    """
+    Sum up the time backends wait on locks by counting ungranted locks in
+    ``pg_locks`` every ``interval`` seconds, in its own connection.
+    """
+    def __init__(self, interval=0.01):
+        super(LockWaitSampler, self).__init__()
+        self.daemon = True
+        self.interval = interval
+        self.wait = 0.0
+        self.stopped = threading.Event()
+
+    def run(self):
+        cursor = connection.cursor()
+        while not self.stopped.is_set():
+            cursor.execute('SELECT count(DISTINCT pid) FROM pg_locks '
+                           'WHERE NOT granted')
+            self.wait += cursor.fetchone()[0] * self.interval
+            time.sleep(self.interval)
+        connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.wait
+
+
+def can_sample_lock_waits():
+    return 'postgresql' in connection.settings_dict['ENGINE']
+
+
+class Command(NoArgsCommand):
+    help = 'Run concurrent invitations and acceptances and check ' \
+           'invitation stats invariants.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--processes', dest='processes', type='int', default=8,
+                    help='Number of worker processes. Default is 8.'),
+        make_option('--invites', dest='invites', type='int', default=50,
+                    help='Invitations sent by each process. Default is 50.'),
+        make_option('--available', dest='available', type='int',
+                    default=None,
+                    help='Available invitations of the inviter in ' \
+                         'INVITE_ONLY mode. Default is enough for all ' \
+                         'invitations.'),
+        make_option('--keep', dest='keep', action='store_true',
+                    default=False,
+                    help='Don\'t delete created users and invitations.'),
+    )
+
+    def handle_noargs(self, **options):
+        processes = options['processes']
+        invites = options['invites']
+        inviter = self.setup(options['available'] or processes * invites + 1)
+        try:
+            invitation = Invitation.objects.invite(inviter,
+                                                   '%s@example.com' % PREFIX)
+            before = self.stats(inviter)
+            close_connection()
+            pool = Pool(processes)
+            try:
+                start_at = time.time() + 1
+                invite_results, invite_wait = self.run_sampled(pool,
+                    invite_worker,
+                    [(i, invites, start_at) for i in range(processes)])
+                invite_results = sum(invite_results, [])
+                start_at = time.time() + 1
+                accept_results, accept_wait = self.run_sampled(pool,
+                    accept_worker,
+                    [(i, invitation.key, start_at) for i in range(processes)])
+            finally:
+                pool.close()
+                pool.join()
+            after = self.stats(inviter)
+            self.report('invite', invite_results, invite_wait)
+            self.report('accept', accept_results, accept_wait)
+            self.check(before, after, invite_results, accept_results)
+        finally:
+            if not options['keep']:
+                self.cleanup()
+
+    def run_sampled(self, pool, worker, args):
+        """
+        Return results of ``worker`` mapped over ``args`` in ``pool`` and
+        the seconds spent waiting on locks meanwhile, ``None`` if lock
+        waits can't be sampled.
+        """
+        if not can_sample_lock_waits():
+            return pool.map(worker, args), None
+        sampler = LockWaitSampler()
+        sampler.start()
+        try:
+            results = pool.map(worker, args)
+        finally:
+            wait = sampler.stop()
+        return results, wait
+
+    def setup(self, available):
+        self.cleanup()
+        inviter = User.objects.create_user(INVITER,
+                                           '%s@example.com' % INVITER,
+                                           PASSWORD)
+        InvitationStats.objects.filter(user=inviter).update(
+                                                        available=available)
+        return inviter
+
+    def cleanup(self):
+        Invitation.objects.filter(email__startswith=PREFIX).delete()
+        User.objects.filter(username__startswith=PREFIX).delete()
+
+    def stats(self, user):
+        return InvitationStats.objects.filter(user=user).values(
+                                          'available', 'sent', 'accepted')[0]
+
+    def report(self, name, results, lock_wait=None):
+        successes = len([r for r in results if r[0]])
+        errors = [r[2] for r in results if r[2]]
+        latencies = sorted(r[1] for r in results)
+        total = sum(latencies)
+        print '%s: %s requests, %s succeeded, %s database errors' % (
+                                name, len(results), successes, len(errors))
+        if latencies:
+            print '  latency avg %.1fms, p95 %.1fms, max %.1fms' % (
+                        total / len(latencies) * 1000,
+                        latencies[int(len(latencies) * 0.95)] * 1000,
+                        latencies[-1] * 1000)
+            print '  throughput %.1f requests/s per process' % (
+                                                    len(latencies) / total)
+        if lock_wait is not None:
+            print '  lock wait %.1fms in total, sampled from pg_locks' % (
+                                                           lock_wait * 1000)
+        locked = [r[1] for r in results if r[2] and 'lock' in r[2].lower()]
+        if locked:
+            print '  %s lock errors, %.1fms spent in these requests' % (
+                                          len(locked), sum(locked) * 1000)
+
+    def check(self, before, after, invite_results, accept_results):
+        invited = len([r for r in invite_results if r[0]])
+        accepted = len([r for r in accept_results if r[0]])
+        failures = []
+        if after['accepted'] > after['sent']:
+            failures.append('accepted > sent')
+        if app_settings.INVITE_ONLY and after['available'] < 0:
+            failures.append('available < 0')
+        if after['sent'] - before['sent'] != invited:
+            failures.append('sent increased by %s for %s invitations' % (
+                                      after['sent'] - before['sent'], invited))
+        if accepted != 1:
+            failures.append('invitation accepted %s times' % accepted)
+        if after['accepted'] - before['accepted'] != accepted:
+            failures.append('accepted increased by %s for %s acceptances' % (
+                          after['accepted'] - before['accepted'], accepted))
+        if failures:
+            print 'FAILED: %s' % ', '.join(failures)
+        else:
+            print 'OK: %(available)s available, %(sent)s sent, ' \
+                  '%(accepted)s accepted' % after
@@ -0,0 +1,22 @@
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from invitation.models import Invitation
+
+
+class Command(NoArgsCommand):
+    help = 'Fill in normalized e-mails of existing invitations.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--all', dest='all', action='store_true', default=False,
+                    help='Normalize all invitations, not only the ones ' \
+                         'without a normalized e-mail.'),
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=1000,
+                    help='Number of invitations updated in each ' \
+                         'transaction.'),
+    )
+
+    def handle_noargs(self, **options):
+        count = Invitation.objects.normalize_emails(options['batch_size'],
+                                                    not options['all'])
+        if int(options.get('verbosity', 1)) > 0:
+            print "Normalized %s invitations" % count
@@ -0,0 +1,9 @@
+from django.core.management.base import NoArgsCommand
+from invitation.dashboard import refresh_dashboard
+
+
+class Command(NoArgsCommand):
+    help = 'Recalculate cached invitation dashboard figures.'
+
+    def handle_noargs(self, **options):
+        refresh_dashboard()
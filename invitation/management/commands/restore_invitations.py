@@ -0,0 +1,40 @@
+import datetime
+import itertools
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from invitation.archive import JSONLinesArchive
+from invitation.models import Invitation, ArchivedInvitation
+
+
+class Command(NoArgsCommand):
+    help = 'Move archived invitations back to the invitation table.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--days', dest='days', type='int', default=None,
+                    help='Restore only invitations sent in this many days.'),
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=1000,
+                    help='Number of invitations moved in each transaction.'),
+        make_option('--file', dest='file', default=None,
+                    help='Restore invitations from this JSON Lines file ' \
+                         'instead of the archive table.'),
+    )
+
+    def handle_noargs(self, **options):
+        since = None
+        if options['days'] is not None:
+            since = datetime.datetime.now() - \
+                                        datetime.timedelta(options['days'])
+        if options['file']:
+            rows = (row for row in JSONLinesArchive(options['file']) \
+                    if since is None or row['date_invited'] >= since)
+            count = 0
+            while True:
+                batch = list(itertools.islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                count += Invitation.objects.restore(batch)
+        else:
+            count = ArchivedInvitation.objects.restore(since,
+                                                       options['batch_size'])
+        if int(options.get('verbosity', 1)) > 0:
+            print "Restored %s invitations" % count
@@ -0,0 +1,21 @@
+import datetime
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from invitation.models import InvitationRollup
+
+
+class Command(NoArgsCommand):
+    help = 'Calculate daily per-inviter invitation aggregates.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--days', dest='days', type='int', default=2,
+                    help='Number of days to roll up, ending today. ' \
+                         'Default is 2 (yesterday and today).'),
+    )
+
+    def handle_noargs(self, **options):
+        today = datetime.date.today()
+        for offset in reversed(range(options['days'])):
+            date = today - datetime.timedelta(offset)
+            count = InvitationRollup.objects.rollup(date)
+            if int(options.get('verbosity', 1)) > 0:
+                print "%s: %s inviters" % (date, count)
@@ -1,7 +1,9 @@
 import datetime
+import logging
 import random
-from django.db import models
-from django.core.mail import send_mail
+from django.db import models, connections, router, transaction
+from django.core.cache import cache
+from django.core.mail import get_connection, send_mail
 from django.conf import settings
 from django.template.loader import render_to_string
 from django.utils.translation import ugettext_lazy as _
@@ -9,7 +11,12 @@ from django.utils.hashcompat import sha_constructor
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site, RequestSite
 import app_settings
+import fraud
 import signals
+from routers import use_primary
+
+
+logger = logging.getLogger('invitation')
 
 
 def performance_calculator_invite_only(invitation_stats):
@@ -26,8 +33,10 @@ def performance_calculator_invite_only(invitation_stats):
 
 
 def performance_calculator_invite_optional(invitation_stats):
+    # Suspect acceptances don't count, see invitation.fraud
+    accepted = invitation_stats.accepted - invitation_stats.flagged
     try:
-        accept_ratio = float(invitation_stats.accepted) / invitation_stats.sent
+        accept_ratio = float(accepted) / invitation_stats.sent
         return min(accept_ratio, 1.0)
     except ZeroDivisionError:
         return 0.0
@@ -39,49 +48,275 @@ DEFAULT_PERFORMANCE_CALCULATORS = {
 }
 
 
+def normalize_email(email):
+    """
+    Return the form of ``email`` used to detect duplicate invitations.
+
+    The address is lowercased. If ``INVITATION_DEDUP_STRIP_PLUS_TAG`` is
+    ``True`` a ``+tag`` suffix in the local part is removed as well.
+    """
+    email = email.strip().lower()
+    if app_settings.DEDUP_STRIP_PLUS_TAG and '@' in email:
+        local_part, domain = email.rsplit('@', 1)
+        email = '%s@%s' % (local_part.split('+', 1)[0], domain)
+    return email
+
+
+def make_key(user, email):
+    """Return a new random invitation key.
+    """
+    key = '%s%0.16f%s%s' % (settings.SECRET_KEY,
+                            random.random(),
+                            user.email,
+                            email)
+    return sha_constructor(key).hexdigest()
+
+
+def lookup_cache_key(invitation_key):
+    return 'invitation.lookup.%s' % invitation_key
+
+
+class RoutedManager(models.Manager):
+    """
+    Manager with shortcuts to pick the database regardless of
+    ``invitation.routers.InvitationRouter`` pinning.
+    """
+    def on_primary(self):
+        """Return a manager reading from ``INVITATION_WRITE_DATABASE``.
+        """
+        return self.db_manager(app_settings.WRITE_DATABASE)
+
+    def on_replica(self):
+        """
+        Return a manager reading from ``INVITATION_READ_DATABASE``, for
+        read-only paths that tolerate replication lag.
+        """
+        return self.db_manager(app_settings.READ_DATABASE or \
+                               app_settings.WRITE_DATABASE)
+
+
 class InvitationError(Exception):
     pass
 
 
-class InvitationManager(models.Manager):
-    def invite(self, user, email):
+class InvitationManager(RoutedManager):
+    @use_primary
+    def invite(self, user, email, ip=None):
         """
-        Get or create an invitation for ``email`` from ``user``.
+        Get or create an invitation for ``email`` from ``user``. ``ip`` is
+        the address of ``user`` recorded on a new invitation for
+        ``invitation.fraud`` checks.
 
         This method doesn't an send email. You need to call ``send_email()``
         method on returned ``Invitation`` instance.
+
+        If ``INVITATION_GLOBAL_DEDUP`` is ``True`` an outstanding invitation
+        for the same (normalized) address is returned even if it was sent by
+        another user. In that case ``invitation.user`` is not ``user`` and
+        no invitation is used from ``user``'s stats.
+
+        Raises ``InvitationError`` if ``user`` doesn't have available
+        invitations, exceeds ``INVITATION_QUOTA_WINDOWS`` or ``email`` is
+        suppressed, see ``SuppressedEmail``.
         """
+        if SuppressedEmail.objects.is_suppressed(email):
+            raise InvitationError('Invitations to this address are ' \
+                                  'suppressed.')
         invitation = None
-        try:
-            # It is possible that there is more than one invitation fitting
-            # the criteria. Normally this means some older invitations are
-            # expired or an email is invited consequtively.
-            invitation = self.filter(user=user, email=email)[0]
-            if not invitation.is_valid():
-                invitation = None
-        except (Invitation.DoesNotExist, IndexError):
-            pass
+        if app_settings.GLOBAL_DEDUP:
+            try:
+                invitation = self.valid().filter(
+                                normalized_email=normalize_email(email))[0]
+            except IndexError:
+                pass
+        else:
+            try:
+                # It is possible that there is more than one invitation
+                # fitting the criteria. Normally this means some older
+                # invitations are expired or an email is invited
+                # consequtively.
+                invitation = self.filter(user=user, email=email)[0]
+                if not invitation.is_valid():
+                    invitation = None
+            except (Invitation.DoesNotExist, IndexError):
+                pass
         if invitation is None:
+            self.check_quota(user)
             user.invitation_stats.use()
-            key = '%s%0.16f%s%s' % (settings.SECRET_KEY,
-                                    random.random(),
-                                    user.email,
-                                    email)
-            key = sha_constructor(key).hexdigest()
-            invitation = self.create(user=user, email=email, key=key)
+            invitation = self.create(user=user,
+                                     email=email,
+                                     key=make_key(user, email),
+                                     inviter_ip=ip)
         return invitation
     invite.alters_data = True
 
+    @use_primary
+    def invite_many(self, user, emails, ip=None):
+        """
+        Get or create invitations for each address in ``emails`` from
+        ``user``, new invitations record ``ip`` like ``invite()`` does.
+
+        Return a list of ``(email, invitation, created)`` tuples in the
+        order of ``emails``, repeated addresses are included once. Existing
+        invitations are looked up with a single query and ``user``'s stats
+        are updated once for all the new invitations. Raises
+        ``InvitationError``, before creating any invitation, if ``user``
+        doesn't have enough available invitations or the new invitations
+        exceed ``INVITATION_QUOTA_WINDOWS``. Suppressed addresses are
+        returned with ``None`` in place of an invitation.
+
+        Like ``invite()`` this method doesn't send emails and respects
+        ``INVITATION_GLOBAL_DEDUP``.
+        """
+        if app_settings.GLOBAL_DEDUP:
+            identity = normalize_email
+        else:
+            identity = lambda email: email
+        unique_emails, seen = [], set()
+        for email in emails:
+            if identity(email) not in seen:
+                seen.add(identity(email))
+                unique_emails.append(email)
+        suppressed = SuppressedEmail.objects.suppressed(unique_emails)
+        if app_settings.GLOBAL_DEDUP:
+            existing = self.valid().filter(normalized_email__in=seen)
+            existing = dict((i.normalized_email, i) for i in existing)
+        else:
+            existing = self.valid().filter(user=user, email__in=seen)
+            existing = dict((i.email, i) for i in existing)
+        new_emails = set(email for email in unique_emails \
+                         if identity(email) not in existing and \
+                            normalize_email(email) not in suppressed)
+        if new_emails:
+            self.check_quota(user, len(new_emails))
+            user.invitation_stats.use(len(new_emails))
+        result = []
+        for email in unique_emails:
+            if normalize_email(email) in suppressed:
+                result.append((email, None, False))
+            elif email in new_emails:
+                invitation = self.create(user=user,
+                                         email=email,
+                                         key=make_key(user, email),
+                                         inviter_ip=ip)
+                result.append((email, invitation, True))
+            else:
+                result.append((email, existing[identity(email)], False))
+        return result
+    invite_many.alters_data = True
+
+    def with_inviters(self):
+        """Return invitations with their senders selected in the same query.
+        """
+        return self.get_query_set().select_related('user')
+
+    def attach_inviters(self, invitations):
+        """
+        Load senders of ``invitations`` that are not already loaded with a
+        single query. Return ``invitations`` as a list.
+        """
+        invitations = list(invitations)
+        cache_name = self.model._meta.get_field('user').get_cache_name()
+        missing = [i for i in invitations if not hasattr(i, cache_name)]
+        if missing:
+            users = User.objects.in_bulk(set(i.user_id for i in missing))
+            for invitation in missing:
+                setattr(invitation, cache_name, users[invitation.user_id])
+        return invitations
+
+    def send_emails(self, invitations, site=None, connection=None,
+                    request=None):
+        """
+        Send emails of ``invitations``.
+
+        Senders are loaded with ``attach_inviters()``, the current site is
+        looked up once, or taken from ``request`` like ``send_email()``
+        does, and all emails are sent over one email backend
+        ``connection``, a new one is opened if it is not given. Return the
+        number of emails sent.
+        """
+        invitations = self.attach_inviters(invitations)
+        if site is None:
+            if Site._meta.installed:
+                site = Site.objects.get_current()
+            elif request is not None:
+                site = RequestSite(request)
+        own_connection = connection is None
+        if own_connection:
+            connection = get_connection()
+            connection.open()
+        try:
+            for invitation in invitations:
+                invitation.send_email(site=site, connection=connection)
+        finally:
+            if own_connection:
+                connection.close()
+        return len(invitations)
+
+    @use_primary
+    def mark_bounced(self, emails):
+        """
+        Mark outstanding invitations to ``emails`` bounced and give back
+        the invitations to their senders.
+
+        Invitations are updated, and senders' stats are corrected, with a
+        few set based queries regardless of the number of invitations.
+        Bounced invitations can't be found, looked up or claimed anymore.
+        Return the number of invitations marked bounced.
+        """
+        queryset = self.filter(bounced=False,
+                               normalized_email__in=set(normalize_email(e)
+                                                        for e in emails))
+        keys = list(queryset.values_list('key', flat=True))
+        counts = {}
+        for row in queryset.order_by().values('user').annotate(
+                                                   count=models.Count('id')):
+            counts.setdefault(row['count'], []).append(row['user'])
+        updated = queryset.update(bounced=True)
+        for count, user_ids in counts.items():
+            refund = {'sent': models.F('sent') - count}
+            if app_settings.INVITE_ONLY:
+                refund['available'] = models.F('available') + count
+            InvitationStats.objects.filter(user__in=user_ids).update(**refund)
+        cache.delete_many([lookup_cache_key(key) for key in keys])
+        return updated
+    mark_bounced.alters_data = True
+
+    def check_quota(self, user, count=1):
+        """
+        Raise ``InvitationError`` if sending ``count`` more invitations
+        exceeds any of ``INVITATION_QUOTA_WINDOWS`` for ``user``.
+
+        Recent invitations, including accepted ones, are counted with one
+        indexed ``COUNT`` query on both the invitation and the acceptance
+        tables for each window.
+
+        The check is not atomic with creating the invitations, concurrent
+        invitations of the same user may each pass it and exceed a cap by
+        the number of concurrent requests.
+        """
+        now = datetime.datetime.now()
+        for seconds, cap in app_settings.QUOTA_WINDOWS:
+            start = now - datetime.timedelta(seconds=seconds)
+            sent = self.filter(user=user, date_invited__gte=start).count() + \
+                   InvitationAcceptance.objects.filter(
+                                inviter=user, date_invited__gte=start).count()
+            if sent + count > cap:
+                raise InvitationError('No more than %s invitations can be ' \
+                                      'sent in %s seconds.' % (cap, seconds))
+
     def find(self, invitation_key):
         """
         Find a valid invitation for the given key or raise
         ``Invitation.DoesNotExist``.
 
         This function always returns a valid invitation. If an invitation is
-        found but not valid it will be automatically deleted.
+        found but not valid it will be automatically deleted. Bounced
+        invitations are not found but kept.
         """
         try:
-            invitation = self.filter(key=invitation_key)[0]
+            invitation = self.select_related('user').filter(
+                                        key=invitation_key, bounced=False)[0]
         except IndexError:
             raise Invitation.DoesNotExist
         if not invitation.is_valid():
@@ -89,27 +324,206 @@ class InvitationManager(models.Manager):
             raise Invitation.DoesNotExist
         return invitation
 
+    def lookup(self, invitation_key):
+        """
+        Return a dictionary with ``email`` and ``date_invited`` keys for a
+        valid invitation with the given key, ``None`` if there isn't one.
+
+        Results, including misses, are cached for
+        ``INVITATION_LOOKUP_CACHE_TTL`` seconds. Cached invitations are
+        invalidated when they are claimed.
+        """
+        if len(invitation_key) > 40:
+            return None
+        cache_key = lookup_cache_key(invitation_key)
+        data = cache.get(cache_key)
+        if data is None:
+            try:
+                data = self.filter(key=invitation_key, bounced=False).values(
+                                                  'email', 'date_invited')[0]
+            except IndexError:
+                data = False
+            cache.set(cache_key, data, app_settings.LOOKUP_CACHE_TTL)
+        expiration = datetime.datetime.now() - datetime.timedelta(
+                                                     app_settings.EXPIRE_DAYS)
+        if not data or data['date_invited'] < expiration:
+            return None
+        return data
+
+    def claim(self, invitation):
+        """
+        Delete ``invitation`` if it is still valid.
+
+        Return ``True`` if the invitation is deleted by this call, ``False``
+        if it is expired, bounced or already deleted, for instance by a
+        concurrent acceptance. A single conditional ``DELETE`` is issued, so
+        only one of concurrent claims can succeed.
+        """
+        expiration = datetime.datetime.now() - datetime.timedelta(
+                                                     app_settings.EXPIRE_DAYS)
+        using = router.db_for_write(self.model, instance=invitation)
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        opts = self.model._meta
+        cursor = connection.cursor()
+        cursor.execute('DELETE FROM %s WHERE %s = %%s AND %s >= %%s '
+                       'AND %s = %%s' % (
+                           qn(opts.db_table),
+                           qn(opts.pk.column),
+                           qn(opts.get_field('date_invited').column),
+                           qn(opts.get_field('bounced').column)),
+                       [invitation.pk,
+                        connection.ops.value_to_db_datetime(expiration),
+                        False])
+        transaction.commit_unless_managed(using=using)
+        cache.delete(lookup_cache_key(invitation.key))
+        return cursor.rowcount == 1
+    claim.alters_data = True
+
+    def sent_by(self, user, after=None, limit=20):
+        """
+        Return up to ``limit`` invitations sent by ``user``, newest first.
+
+        Invitations are returned as dictionaries with ``id``, ``email``,
+        ``key`` and ``date_invited`` keys. Pages are seeked by
+        ``(date_invited, id)`` instead of an offset; pass ``after`` as
+        the ``(date_invited, id)`` of the last invitation of the previous
+        page to get the next page.
+        """
+        queryset = self.filter(user=user)
+        if after is not None:
+            date_invited, pk = after
+            queryset = queryset.filter(
+                                models.Q(date_invited__lt=date_invited) |
+                                models.Q(date_invited=date_invited, id__lt=pk))
+        queryset = queryset.order_by('-date_invited', '-id')
+        return list(queryset.values('id', 'email', 'key',
+                                    'date_invited')[:limit])
+
     def valid(self):
-        """Filter valid invitations.
+        """Filter valid invitations, bounced invitations are not valid.
         """
         expiration = datetime.datetime.now() - datetime.timedelta(
                                                      app_settings.EXPIRE_DAYS)
-        return self.get_query_set().filter(date_invited__gte=expiration)
+        return self.get_query_set().filter(date_invited__gte=expiration,
+                                           bounced=False)
 
     def invalid(self):
         """Filter invalid invitation.
         """
         expiration = datetime.datetime.now() - datetime.timedelta(
                                                      app_settings.EXPIRE_DAYS)
-        return self.get_query_set().filter(date_invited__le=expiration)
+        return self.get_query_set().filter(date_invited__lt=expiration)
+
+    @use_primary
+    def archive(self, before, batch_size=1000, store=None):
+        """
+        Move invitations sent before ``before`` out of the invitation table.
+
+        Invitations are moved in batches of ``batch_size``, each batch is
+        committed in its own transaction. ``store`` is a callable that takes
+        a list of dictionaries with ``user_id``, ``email``, ``key``,
+        ``date_invited`` and ``bounced`` keys and stores them, default is
+        ``ArchivedInvitation.objects.store``. Return the number of
+        invitations archived.
+        """
+        store = store or ArchivedInvitation.objects.store
+        queryset = self.filter(date_invited__lt=before).order_by('pk')
+        @transaction.commit_on_success
+        def archive_batch():
+            rows = list(queryset.values_list('pk', 'user', 'email', 'key',
+                                             'date_invited',
+                                             'bounced')[:batch_size])
+            if rows:
+                store([{'user_id': user_id,
+                        'email': email,
+                        'key': key,
+                        'date_invited': date_invited,
+                        'bounced': bounced}
+                       for pk, user_id, email, key, date_invited, bounced \
+                           in rows])
+                self.filter(pk__in=[row[0] for row in rows]).delete()
+            return len(rows)
+        count = 0
+        while True:
+            archived = archive_batch()
+            count += archived
+            if archived < batch_size:
+                return count
+    archive.alters_data = True
+
+    def restore(self, rows):
+        """
+        Create invitations from archived ``rows``.
+
+        ``rows`` is an iterable of dictionaries as given to ``store`` of
+        ``archive()``. Rows with keys already in the invitation table are
+        skipped. Return the number of invitations restored.
+        """
+        rows = list(rows)
+        existing = set(self.filter(key__in=[row['key'] for row in rows]) \
+                           .values_list('key', flat=True))
+        count = 0
+        for row in rows:
+            if row['key'] not in existing:
+                self.create(**row)
+                count += 1
+        return count
+    restore.alters_data = True
+
+    @use_primary
+    def normalize_emails(self, batch_size=1000, only_missing=True):
+        """
+        Set ``normalized_email`` of invitations saved before the column
+        existed, or of all invitations if ``only_missing`` is ``False``,
+        e.g. after changing ``INVITATION_DEDUP_STRIP_PLUS_TAG``.
+
+        Invitations are updated in batches of ``batch_size``, each batch is
+        committed in its own transaction. Return the number of invitations
+        updated.
+        """
+        queryset = self.order_by('pk')
+        if only_missing:
+            queryset = queryset.filter(normalized_email='')
+        @transaction.commit_on_success
+        def normalize_batch(last_pk):
+            rows = list(queryset.filter(pk__gt=last_pk) \
+                                .values_list('pk', 'email',
+                                             'normalized_email')[:batch_size])
+            updated = 0
+            for pk, email, normalized_email in rows:
+                if normalize_email(email) != normalized_email:
+                    self.filter(pk=pk).update(
+                                    normalized_email=normalize_email(email))
+                    updated += 1
+            return rows and rows[-1][0], len(rows), updated
+        last_pk, count = 0, 0
+        while True:
+            last_pk, fetched, updated = normalize_batch(last_pk)
+            count += updated
+            if fetched < batch_size:
+                return count
+    normalize_emails.alters_data = True
 
 
 class Invitation(models.Model):
     user = models.ForeignKey(User, related_name='invitations')
     email = models.EmailField(_(u'e-mail'))
+    normalized_email = models.CharField(_(u'normalized e-mail'),
+                                        max_length=75,
+                                        db_index=True,
+                                        editable=False)
     key = models.CharField(_(u'invitation key'), max_length=40, unique=True)
     date_invited = models.DateTimeField(_(u'date invited'),
-                                        default=datetime.datetime.now)
+                                        default=datetime.datetime.now,
+                                        db_index=True)
+    bounced = models.BooleanField(_(u'bounced'), default=False)
+    # Long enough for IPv6 addresses, IPAddressField only fits IPv4
+    inviter_ip = models.CharField(_(u'inviter IP address'),
+                                  max_length=45,
+                                  null=True,
+                                  blank=True,
+                                  editable=False)
 
     objects = InvitationManager()
 
@@ -125,6 +539,10 @@ class Invitation(models.Model):
             'date': str(self.date_invited.date()),
         }
 
+    def save(self, *args, **kwargs):
+        self.normalized_email = normalize_email(self.email)
+        super(Invitation, self).save(*args, **kwargs)
+
     @models.permalink
     def get_absolute_url(self):
         return ('invitation_register', (), {'invitation_key': self.key})
@@ -136,8 +554,21 @@ class Invitation(models.Model):
     def is_valid(self):
         """
         Return ``True`` if the invitation is still valid, ``False`` otherwise.
+        Bounced invitations are not valid.
+        """
+        return not self.bounced and datetime.datetime.now() < self._expires_at
+
+    @property
+    def inviter_context(self):
         """
-        return datetime.datetime.now() < self._expires_at
+        A dictionary with ``username`` and ``full_name`` of the sender.
+
+        Use ``InvitationManager.with_inviters()`` or
+        ``InvitationManager.attach_inviters()`` to load the senders of many
+        invitations at once.
+        """
+        return {'username': self.user.username,
+                'full_name': self.user.get_full_name()}
 
     def expiration_date(self):
         """Return a ``datetime.date()`` object representing expiration date.
@@ -146,12 +577,15 @@ class Invitation(models.Model):
     expiration_date.short_description = _(u'expiration date')
     expiration_date.admin_order_field = 'date_invited'
 
-    def send_email(self, email=None, site=None, request=None):
+    def send_email(self, email=None, site=None, request=None,
+                   connection=None):
         """
         Send invitation email.
 
         Both ``email`` and ``site`` parameters are optional. If not supplied
-        instance's ``email`` field and current site will be used.
+        instance's ``email`` field and current site will be used. An email
+        backend ``connection`` can be supplied to send many emails over the
+        same connection.
 
         **Templates:**
 
@@ -161,6 +595,7 @@ class Invitation(models.Model):
             **Context:**
 
             :invitation: ``Invitation`` instance ``send_email`` is called on.
+            :inviter: ``inviter_context`` of the invitation.
             :site: ``Site`` instance to be used.
 
         :invitation/invitation_email.txt:
@@ -169,6 +604,7 @@ class Invitation(models.Model):
             **Context:**
 
             :invitation: ``Invitation`` instance ``send_email`` is called on.
+            :inviter: ``inviter_context`` of the invitation.
             :expiration_days: ``INVITATION_EXPIRE_DAYS`` setting.
             :site: ``Site`` instance to be used.
 
@@ -182,34 +618,66 @@ class Invitation(models.Model):
                 site = Site.objects.get_current()
             elif request is not None:
                 site = RequestSite(request)
+        inviter = self.inviter_context
         subject = render_to_string('invitation/invitation_email_subject.txt',
-                                   {'invitation': self, 'site': site})
+                                   {'invitation': self,
+                                    'inviter': inviter,
+                                    'site': site})
         # Email subject *must not* contain newlines
         subject = ''.join(subject.splitlines())
         message = render_to_string('invitation/invitation_email.txt', {
             'invitation': self,
+            'inviter': inviter,
             'expiration_days': app_settings.EXPIRE_DAYS,
             'site': site
         })
-        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [email])
+        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [email],
+                  connection=connection)
         signals.invitation_sent.send(sender=self)
 
-    def mark_accepted(self, new_user):
+    @use_primary
+    def mark_accepted(self, new_user, request=None):
         """
-        Update sender's invitation statistics and delete self.
+        Delete self, update sender's invitation statistics, record the
+        acceptance in ``InvitationAcceptance`` log and add ``new_user`` to
+        the invite tree under the sender.
+
+        The acceptance is checked with ``invitation.fraud`` checks, given
+        the registration ``request`` if available. Suspect acceptances are
+        flagged and don't count for the sender's performance.
 
-        ``invitation.signals.invitation_accepted`` is sent just before the
+        Raises ``InvitationError`` if the invitation is expired, bounced or
+        already accepted. Only one of concurrent calls for the same
+        invitation can succeed. Call this method inside the transaction that
+        creates ``new_user``, so that the new user is rolled back if the
+        invitation can't be claimed. ``views.register`` does this.
+
+        ``invitation.signals.invitation_accepted`` is sent after the
         instance is deleted.
         """
-        self.user.invitation_stats.mark_accepted()
+        if not Invitation.objects.claim(self):
+            raise InvitationError('Invitation is expired, bounced or ' \
+                                  'already accepted.')
+        reasons = fraud.check(self, new_user, request)
+        InvitationStats.objects.mark_accepted(self.user_id,
+                                              flagged=bool(reasons))
+        InvitationAcceptance.objects.create(inviter_id=self.user_id,
+                                            invitee=new_user,
+                                            date_invited=self.date_invited,
+                                            suspect=bool(reasons),
+                                            reasons=' '.join(reasons))
+        InviteTreeNode.objects.add(self.user, new_user)
         signals.invitation_accepted.send(sender=self,
                                          inviting_user=self.user,
                                          new_user=new_user)
-        self.delete()
     mark_accepted.alters_data = True
 
 
-class InvitationStatsManager(models.Manager):
+def initial_invitations():
+    return app_settings.INITIAL_INVITATIONS
+
+
+class InvitationStatsManager(RoutedManager):
     def give_invitations(self, user=None, count=None):
         rewarded_users = 0
         invitations_given = 0
@@ -230,7 +698,66 @@ class InvitationStatsManager(models.Manager):
                 invitations_given += c
         return rewarded_users, invitations_given
 
-    def reward(self, user=None, reward_count=app_settings.INITIAL_INVITATIONS):
+    def use(self, user, count=1):
+        """
+        Mark ``count`` invitations of ``user`` used.
+
+        In invite only mode available count is checked and decremented
+        with a single conditional ``UPDATE``, so concurrent calls can't
+        overdraw it. Raises ``InvitationError`` if ``count`` is more than
+        available invitations.
+        """
+        queryset = self.filter(user=user)
+        values = {'sent': models.F('sent') + count}
+        if app_settings.INVITE_ONLY:
+            queryset = queryset.filter(available__gte=count)
+            values['available'] = models.F('available') - count
+        if not queryset.update(**values):
+            raise InvitationError('No available invitations.')
+    use.alters_data = True
+
+    def mark_accepted(self, user, count=1, flagged=False):
+        """
+        Mark ``count`` invitations of ``user`` accepted, and flagged as
+        suspect if ``flagged`` is ``True``.
+
+        Accepted count is checked against sent count and incremented with
+        a single conditional ``UPDATE``. Raises ``InvitationError`` if more
+        invitations than possible is being accepted.
+        """
+        values = {'accepted': models.F('accepted') + count}
+        if flagged:
+            values['flagged'] = models.F('flagged') + count
+        updated = self.filter(
+            user=user,
+            accepted__lte=models.F('sent') - count,
+        ).update(**values)
+        if not updated:
+            raise InvitationError('There can\'t be more accepted ' \
+                                  'invitations than sent invitations.')
+    mark_accepted.alters_data = True
+
+    def reward(self, user=None, reward_count=None):
+        """
+        Give ``reward_count`` invitations to users with performance of at
+        least ``INVITATION_REWARD_THRESHOLD``.
+
+        If ``user`` is not given all users are scored at once using an
+        ``invitation.snapshot.StatsSnapshot``.
+        """
+        if reward_count is None:
+            reward_count = app_settings.INITIAL_INVITATIONS
+        if user is None:
+            from invitation.snapshot import StatsSnapshot
+            user_ids = StatsSnapshot.load().above(
+                                                 app_settings.REWARD_THRESHOLD)
+            rewarded_users = 0
+            for i in range(0, len(user_ids), 1000):
+                for instance in self.select_related('user').filter(
+                                                user__in=user_ids[i:i + 1000]):
+                    instance.add_available(reward_count)
+                    rewarded_users += 1
+            return rewarded_users, rewarded_users * reward_count
         def count(user):
             if user.invitation_stats.performance >= \
                                                 app_settings.REWARD_THRESHOLD:
@@ -245,9 +772,10 @@ class InvitationStats(models.Model):
     user = models.OneToOneField(User,
                                 related_name='invitation_stats')
     available = models.IntegerField(_(u'available invitations'),
-                                    default=app_settings.INITIAL_INVITATIONS)
+                                    default=initial_invitations)
     sent = models.IntegerField(_(u'invitations sent'), default=0)
     accepted = models.IntegerField(_(u'invitations accepted'), default=0)
+    flagged = models.IntegerField(_(u'suspect acceptances'), default=0)
 
     objects = InvitationStatsManager()
 
@@ -281,6 +809,7 @@ class InvitationStats(models.Model):
         signals.invitation_added.send(sender=self, user=self.user, count=count)
     add_available.alters_data = True
 
+    @use_primary
     def use(self, count=1):
         """
         Mark invitations used.
@@ -293,13 +822,7 @@ class InvitationStats(models.Model):
         :count:
             Number of invitations to mark used. Default is ``1``.
         """
-        if app_settings.INVITE_ONLY:
-            if self.available - count >= 0:
-                self.available = models.F('available') - count
-            else:
-                raise InvitationError('No available invitations.')
-        self.sent = models.F('sent') + count
-        self.save()
+        InvitationStats.objects.use(self.user_id, count)
     use.alters_data = True
 
     def mark_accepted(self, count=1):
@@ -314,14 +837,317 @@ class InvitationStats(models.Model):
         :count:
             Optional. Number of invitations to mark accepted. Default is ``1``.
         """
-        if self.accepted + count > self.sent:
-            raise InvitationError('There can\'t be more accepted ' \
-                                  'invitations than sent invitations.')
-        self.accepted = models.F('accepted') + count
-        self.save()
+        InvitationStats.objects.mark_accepted(self.user_id, count)
     mark_accepted.alters_data = True
 
 
+class SuppressedEmailManager(RoutedManager):
+    def is_suppressed(self, email):
+        return self.filter(normalized_email=normalize_email(email)).exists()
+
+    def suppressed(self, emails):
+        """
+        Return the set of normalized forms of suppressed ``emails``.
+        """
+        return set(self.filter(normalized_email__in=set(normalize_email(e)
+                                                        for e in emails)) \
+                       .values_list('normalized_email', flat=True))
+
+    def suppress(self, emails, reason=''):
+        """
+        Suppress invitations to ``emails``. Return the number of newly
+        suppressed addresses.
+        """
+        emails = set(normalize_email(email) for email in emails)
+        new_emails = emails - self.suppressed(emails)
+        for email in new_emails:
+            self.create(normalized_email=email, reason=reason)
+        return len(new_emails)
+    suppress.alters_data = True
+
+
+class SuppressedEmail(models.Model):
+    """
+    An address no invitations are sent to, e.g. because a previous
+    invitation bounced.
+    """
+    normalized_email = models.CharField(_(u'normalized e-mail'),
+                                        max_length=75,
+                                        unique=True)
+    reason = models.CharField(_(u'reason'), max_length=100, blank=True)
+    date_added = models.DateTimeField(_(u'date added'),
+                                      default=datetime.datetime.now)
+
+    objects = SuppressedEmailManager()
+
+    class Meta:
+        verbose_name = _(u'suppressed e-mail')
+        verbose_name_plural = _(u'suppressed e-mails')
+
+
+class ArchivedInvitationManager(RoutedManager):
+    def store(self, rows):
+        for row in rows:
+            self.create(**row)
+    store.alters_data = True
+
+    def restore(self, since=None, batch_size=1000):
+        """
+        Move archived invitations back to the invitation table.
+
+        Only invitations sent on or after ``since`` are restored if it is
+        given. Return the number of invitations restored.
+        """
+        queryset = self.order_by('pk')
+        if since is not None:
+            queryset = queryset.filter(date_invited__gte=since)
+        @transaction.commit_on_success
+        def restore_batch():
+            rows = list(queryset.values_list('pk', 'user', 'email', 'key',
+                                             'date_invited',
+                                             'bounced')[:batch_size])
+            restored = Invitation.objects.restore(
+                             {'user_id': user_id,
+                              'email': email,
+                              'key': key,
+                              'date_invited': date_invited,
+                              'bounced': bounced}
+                             for pk, user_id, email, key, date_invited,
+                                 bounced in rows)
+            self.filter(pk__in=[row[0] for row in rows]).delete()
+            return len(rows), restored
+        count = 0
+        while True:
+            processed, restored = restore_batch()
+            count += restored
+            if processed < batch_size:
+                return count
+    restore.alters_data = True
+
+
+class ArchivedInvitation(models.Model):
+    """
+    An invitation moved out of the invitation table by
+    ``InvitationManager.archive()``.
+    """
+    user = models.ForeignKey(User, related_name='archived_invitations')
+    email = models.EmailField(_(u'e-mail'))
+    key = models.CharField(_(u'invitation key'), max_length=40)
+    date_invited = models.DateTimeField(_(u'date invited'), db_index=True)
+    bounced = models.BooleanField(_(u'bounced'), default=False)
+    date_archived = models.DateTimeField(_(u'date archived'),
+                                         default=datetime.datetime.now)
+
+    objects = ArchivedInvitationManager()
+
+    class Meta:
+        verbose_name = _(u'archived invitation')
+        verbose_name_plural = _(u'archived invitations')
+
+
+class InvitationAcceptanceManager(RoutedManager):
+    def between(self, start, end):
+        """
+        Filter acceptances with ``start <= date_accepted < end``.
+        """
+        return self.get_query_set().filter(date_accepted__gte=start,
+                                           date_accepted__lt=end)
+
+
+class InvitationAcceptance(models.Model):
+    """
+    Append-only log of accepted invitations.
+
+    A record is created in the same transaction an invitation is accepted.
+    Accepted ``Invitation`` instances are deleted, this is the only
+    per-invitation history kept.
+    """
+    inviter = models.ForeignKey(User, related_name='invitation_acceptances')
+    invitee = models.OneToOneField(User, related_name='accepted_invitation')
+    date_invited = models.DateTimeField(_(u'date invited'), db_index=True)
+    date_accepted = models.DateTimeField(_(u'date accepted'),
+                                         default=datetime.datetime.now,
+                                         db_index=True)
+    suspect = models.BooleanField(_(u'suspect'), default=False,
+                                  db_index=True)
+    reasons = models.CharField(_(u'reasons'), max_length=100, blank=True)
+
+    objects = InvitationAcceptanceManager()
+
+    class Meta:
+        verbose_name = _(u'invitation acceptance')
+        verbose_name_plural = _(u'invitation acceptances')
+
+
+class InvitationRollupManager(RoutedManager):
+    def rollup(self, date):
+        """
+        (Re)calculate daily per-inviter aggregates for ``date``.
+
+        Invitations sent on ``date`` are counted from both outstanding
+        invitations and the acceptance log, since accepted invitations are
+        deleted. Existing aggregates for ``date`` are replaced. Return the
+        number of inviters with invitations sent or accepted on that day.
+        """
+        start = datetime.datetime.combine(date, datetime.time())
+        end = start + datetime.timedelta(1)
+        totals = {}
+        def add(queryset, user_field, counter):
+            rows = queryset.order_by().values(user_field).annotate(
+                                                   count=models.Count('id'))
+            for row in rows:
+                counts = totals.setdefault(row[user_field],
+                                           {'sent': 0, 'accepted': 0})
+                counts[counter] += row['count']
+        add(Invitation.objects.filter(date_invited__gte=start,
+                                      date_invited__lt=end),
+            'user', 'sent')
+        add(InvitationAcceptance.objects.filter(date_invited__gte=start,
+                                                date_invited__lt=end),
+            'inviter', 'sent')
+        add(InvitationAcceptance.objects.between(start, end),
+            'inviter', 'accepted')
+        self.filter(date=date).delete()
+        for inviter_id, counts in totals.items():
+            self.create(inviter_id=inviter_id, date=date, **counts)
+        return len(totals)
+    rollup.alters_data = True
+
+
+class InvitationRollup(models.Model):
+    """Daily invitation aggregates for an inviter.
+    """
+    inviter = models.ForeignKey(User, related_name='invitation_rollups')
+    date = models.DateField(_(u'date'), db_index=True)
+    sent = models.IntegerField(_(u'invitations sent'), default=0)
+    accepted = models.IntegerField(_(u'invitations accepted'), default=0)
+
+    objects = InvitationRollupManager()
+
+    class Meta:
+        verbose_name = _(u'invitation rollup')
+        verbose_name_plural = _(u'invitation rollups')
+        unique_together = (('inviter', 'date'),)
+        ordering = ('-date',)
+
+
+class InviteTreeNodeManager(RoutedManager):
+    def node_for(self, user):
+        """
+        Return the node of ``user``, a root node is created for users who
+        registered without an invitation.
+        """
+        node, created = self.get_or_create(user=user,
+                                           defaults={'path': '%d/' % user.pk,
+                                                     'depth': 0})
+        return node
+
+    def child_path(self, parent, user_id):
+        """
+        Return the path of a child of ``parent``, ``None`` if it doesn't
+        fit in ``path`` column. The subtree of a node without a path can't
+        be queried, but the tree can still grow below it.
+        """
+        if parent.path is None:
+            return None
+        path = '%s%d/' % (parent.path, user_id)
+        max_length = self.model._meta.get_field('path').max_length
+        if len(path) > max_length:
+            logger.warning('Invite tree path of user %s is longer than %s '
+                           'characters, the node is saved without a path.',
+                           user_id, max_length)
+            return None
+        return path
+
+    def add(self, inviter, invitee):
+        """Add ``invitee`` to the tree as a child of ``inviter``.
+        """
+        parent = self.node_for(inviter)
+        return self.create(user=invitee,
+                           parent=parent,
+                           path=self.child_path(parent, invitee.pk),
+                           depth=parent.depth + 1)
+    add.alters_data = True
+
+    def descendants(self, node, depth=None):
+        """
+        Filter nodes below ``node``, only ``depth`` levels deep if given.
+        Nodes too deep to have a path are not included.
+        """
+        if node.path is None:
+            return self.none()
+        qs = self.get_query_set().filter(path__startswith=node.path,
+                                         depth__gt=node.depth)
+        if depth is not None:
+            qs = qs.filter(depth__lte=node.depth + depth)
+        return qs
+
+    def depth_counts(self, node):
+        """
+        Return a dictionary of relative depth to the number of users at that
+        depth below ``node``, counted with a single query.
+        """
+        rows = self.descendants(node).order_by().values('depth').annotate(
+                                                   count=models.Count('id'))
+        return dict((row['depth'] - node.depth, row['count'])
+                    for row in rows)
+
+    def rebuild(self):
+        """
+        Delete all nodes and build the tree again from the
+        ``InvitationAcceptance`` log. Return the number of nodes created.
+        """
+        self.all().delete()
+        nodes = {}
+        acceptances = InvitationAcceptance.objects.order_by(
+                            'date_accepted', 'id').values_list('inviter',
+                                                               'invitee')
+        for inviter_id, invitee_id in acceptances.iterator():
+            if inviter_id not in nodes:
+                nodes[inviter_id] = self.create(user_id=inviter_id,
+                                                path='%d/' % inviter_id,
+                                                depth=0)
+            parent = nodes[inviter_id]
+            nodes[invitee_id] = self.create(
+                                      user_id=invitee_id,
+                                      parent=parent,
+                                      path=self.child_path(parent, invitee_id),
+                                      depth=parent.depth + 1)
+        return len(nodes)
+    rebuild.alters_data = True
+
+
+class InviteTreeNode(models.Model):
+    """
+    Position of a user in the tree of who invited whom.
+
+    ``path`` holds primary keys of the user's ancestors and the user itself,
+    each followed by ``/``, so a subtree is selected with an indexed prefix
+    match. Users who registered without an invitation are roots. Nodes
+    too deep for their path to fit in 255 characters are saved without a
+    path, so tree bookkeeping never fails an acceptance.
+    """
+    user = models.OneToOneField(User, related_name='invite_tree_node')
+    parent = models.ForeignKey('self', null=True, blank=True,
+                               related_name='children')
+    path = models.CharField(_(u'path'), max_length=255, null=True,
+                            db_index=True)
+    depth = models.PositiveIntegerField(_(u'depth'), default=0,
+                                        db_index=True)
+
+    objects = InviteTreeNodeManager()
+
+    class Meta:
+        verbose_name = _(u'invite tree node')
+        verbose_name_plural = _(u'invite tree nodes')
+
+    def __unicode__(self):
+        return u'%s' % (self.path or self.user_id)
+
+    def descendants(self, depth=None):
+        return InviteTreeNode.objects.descendants(self, depth)
+
+
 def create_stats(sender, instance, created, raw, **kwargs):
     if created and not raw:
         InvitationStats.objects.create(user=instance)
@@ -0,0 +1,97 @@
+"""
+Database routing for invitation models.
+
+Add ``"invitation.routers.InvitationRouter"`` to ``DATABASE_ROUTERS`` and
+set ``INVITATION_READ_DATABASE`` to send reads of invitation models to a
+replica. Writes always go to ``INVITATION_WRITE_DATABASE``.
+
+Once a thread writes to an invitation model, its reads are pinned to the
+write database, so it can read its own writes regardless of replication
+lag. Methods that read before they write and must not act on stale data,
+e.g. ``InvitationManager.invite()`` checking available invitations, pin
+the thread up front with ``use_primary``.
+
+The pin is cleared when a request starts, and when an
+``InvitationService`` task is done. Other long running threads, e.g.
+management commands, must call ``unpin()`` themselves to read from the
+replica again. ``InvitationRouterMiddleware`` carries the pin over to the
+following requests of the same client for ``INVITATION_PIN_SECONDS``
+seconds using a cookie.
+"""
+import threading
+from django.core.signals import request_started
+from django.utils.functional import wraps
+from invitation import app_settings
+
+
+PIN_COOKIE = 'invitation_pinned'
+
+
+_state = threading.local()
+
+
+def pin():
+    """
+    Route reads of the current thread to the write database.
+    """
+    _state.pinned = True
+
+
+def unpin():
+    _state.pinned = False
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def unpin_on_request_started(sender, **kwargs):
+    unpin()
+request_started.connect(unpin_on_request_started,
+                        dispatch_uid='invitation.routers.unpin')
+
+
+def use_primary(func):
+    """
+    Decorator that pins the current thread before calling ``func``, so all
+    of its reads go to the write database.
+    """
+    def _wrapped(*args, **kwargs):
+        pin()
+        return func(*args, **kwargs)
+    return wraps(func)(_wrapped)
+
+
+class InvitationRouter(object):
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'invitation':
+            return None
+        if is_pinned() or not app_settings.READ_DATABASE:
+            return app_settings.WRITE_DATABASE
+        return app_settings.READ_DATABASE
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != 'invitation':
+            return None
+        pin()
+        return app_settings.WRITE_DATABASE
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = (app_settings.READ_DATABASE, app_settings.WRITE_DATABASE)
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class InvitationRouterMiddleware(object):
+    def process_request(self, request):
+        if request.COOKIES.get(PIN_COOKIE):
+            pin()
+        else:
+            unpin()
+
+    def process_response(self, request, response):
+        if is_pinned() and not request.COOKIES.get(PIN_COOKIE):
+            response.set_cookie(PIN_COOKIE, '1',
+                                max_age=app_settings.PIN_SECONDS)
+        return response
@@ -0,0 +1,111 @@
+"""
+Run invitation operations concurrently in a bounded pool of threads.
+
+This project targets Django's synchronous ORM, so instead of coroutines
+``InvitationService`` methods return ``multiprocessing.pool.AsyncResult``
+instances. Call ``get()`` on a result to wait for it, or ``ready()`` to
+poll it. Each task closes its database connections and clears the read
+pin of ``invitation.routers`` when it is done, so worker threads don't
+hold connections while idle and later tasks can read from a replica.
+"""
+from multiprocessing.pool import ThreadPool
+from django.core.mail import get_connection
+from django.db import close_connection, transaction
+from invitation import app_settings
+from invitation.models import Invitation
+from invitation.routers import unpin
+
+
+def run_task(func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        unpin()
+        close_connection()
+
+
+@transaction.commit_on_success
+def mark_accepted(invitation, new_user):
+    invitation.mark_accepted(new_user)
+
+
+def send_emails(invitations, site, backend):
+    """
+    Send invitation emails over a single email backend connection, see
+    ``InvitationManager.send_emails()``.
+    """
+    connection = get_connection(backend)
+    connection.open()
+    try:
+        return Invitation.objects.send_emails(invitations, site, connection)
+    finally:
+        connection.close()
+
+
+class InvitationService(object):
+    """
+    Run ``InvitationManager`` and ``Invitation`` operations in at most
+    ``workers`` threads.
+
+    **Optional arguments:**
+
+    :workers:
+        Number of worker threads. Default value is
+        ``INVITATION_SERVICE_WORKERS`` setting.
+
+    :email_backend:
+        Import path of the email backend used to send invitations. Default
+        value is ``INVITATION_EMAIL_BACKEND`` setting, ``EMAIL_BACKEND`` is
+        used if it is ``None``.
+    """
+    def __init__(self, workers=None, email_backend=None):
+        self.pool = ThreadPool(workers or app_settings.SERVICE_WORKERS)
+        self.email_backend = email_backend or app_settings.EMAIL_BACKEND
+
+    def _apply(self, func, *args):
+        return self.pool.apply_async(run_task, (func,) + args)
+
+    def invite(self, user, email, ip=None):
+        """
+        Get or create an invitation, see ``InvitationManager.invite()``.
+        Pass the sender's ``ip`` to enable ``invitation.fraud.same_ip``
+        check on the invitation.
+        """
+        return self._apply(Invitation.objects.invite, user, email, ip)
+
+    def find(self, invitation_key):
+        return self._apply(Invitation.objects.find, invitation_key)
+
+    def send_email(self, invitation, email=None, site=None):
+        return self._apply(invitation.send_email, email, site)
+
+    def mark_accepted(self, invitation, new_user):
+        """
+        Mark ``invitation`` accepted in its own transaction.
+
+        Unlike ``views.register``, ``new_user`` is already committed and
+        is not rolled back if the invitation can't be claimed.
+        """
+        return self._apply(mark_accepted, invitation, new_user)
+
+    def send_emails(self, invitations, site=None, chunk_size=50):
+        """
+        Send emails for ``invitations`` concurrently.
+
+        Invitations are split into chunks of ``chunk_size``, each chunk is
+        sent over one email backend connection. Return a list of results,
+        one for each chunk, holding the number of emails sent.
+        """
+        invitations = list(invitations)
+        return [self._apply(send_emails,
+                            invitations[i:i + chunk_size],
+                            site,
+                            self.email_backend)
+                for i in range(0, len(invitations), chunk_size)]
+
+    def close(self):
+        """
+        Wait for pending tasks and stop worker threads.
+        """
+        self.pool.close()
+        self.pool.join()
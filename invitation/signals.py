@@ -1,8 +1,71 @@
+import threading
+from contextlib import contextmanager
 from django.dispatch import Signal
 
 
-invitation_added = Signal(providing_args=['user', 'count'])
+_state = threading.local()
 
-invitation_sent = Signal()
 
-invitation_accepted = Signal(providing_args=['inviting_user', 'new_user'])
+class BatchableSignal(Signal):
+    """
+    A signal that can be collected by ``batch_signals()`` or dropped by
+    ``suppress_signals()`` in the current thread.
+    """
+    def send(self, sender, **named):
+        if getattr(_state, 'suppressed', 0):
+            return []
+        batch = getattr(_state, 'batch', None)
+        if batch is not None:
+            batch.setdefault(self, []).append((sender, named))
+            return []
+        return super(BatchableSignal, self).send(sender, **named)
+
+
+invitation_added = BatchableSignal(providing_args=['user', 'count'])
+
+invitation_sent = BatchableSignal()
+
+invitation_accepted = BatchableSignal(providing_args=['inviting_user',
+                                                      'new_user'])
+
+invitation_batch = Signal(providing_args=['sends'])
+
+
+@contextmanager
+def batch_signals():
+    """
+    Collect invitation signals sent in the block and send
+    ``invitation_batch`` once for each kind of signal collected when the
+    block exits.
+
+    ``invitation_batch`` is sent with the collected signal as ``sender``
+    and a list of ``(sender, kwargs)`` tuples as ``sends``. Receivers can
+    connect to a specific signal::
+
+        invitation_batch.connect(handler, sender=invitation_added)
+
+    Nested blocks are collected by the outermost block. Nothing is sent if
+    the block raises an exception.
+    """
+    if getattr(_state, 'batch', None) is not None:
+        yield
+        return
+    _state.batch = batch = {}
+    try:
+        yield
+    finally:
+        _state.batch = None
+    for signal, sends in batch.items():
+        invitation_batch.send(sender=signal, sends=sends)
+
+
+@contextmanager
+def suppress_signals():
+    """
+    Drop invitation signals sent in the block, e.g. while importing data.
+    """
+    _state.suppressed = getattr(_state, 'suppressed', 0) + 1
+    try:
+        yield
+    finally:
+        _state.suppressed -= 1
@@ -0,0 +1,132 @@
+"""
+Compact, column-wise snapshot of ``InvitationStats`` for scoring all
+inviters at once.
+
+Stats are stored in ``array`` columns instead of model instances, which
+takes a few bytes per inviter. Default performance calculators are
+evaluated with NumPy if it is installed, in pure Python otherwise.
+"""
+import heapq
+from array import array
+from collections import namedtuple
+from itertools import izip
+from invitation import app_settings
+from invitation.models import InvitationStats
+from invitation.models import DEFAULT_PERFORMANCE_CALCULATORS
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+StatsRow = namedtuple('StatsRow', 'available sent accepted flagged')
+
+
+def ratio(numerator, denominator):
+    """Element-wise ``numerator / denominator``, ``0.0`` where the
+    denominator is ``0``.
+    """
+    result = numpy.zeros(len(numerator))
+    mask = denominator > 0
+    result[mask] = numerator[mask] / denominator[mask]
+    return result
+
+
+class StatsSnapshot(object):
+    """
+    ``user_ids``, ``available``, ``sent``, ``accepted`` and ``flagged``
+    columns of ``InvitationStats``, aligned by index.
+    """
+    def __init__(self):
+        self.user_ids = array('l')
+        self.available = array('l')
+        self.sent = array('l')
+        self.accepted = array('l')
+        self.flagged = array('l')
+
+    @classmethod
+    def load(cls, queryset=None, chunk_size=10000):
+        """
+        Load ``queryset``, all ``InvitationStats`` by default, in chunks
+        of ``chunk_size`` rows.
+        """
+        if queryset is None:
+            queryset = InvitationStats.objects.all()
+        queryset = queryset.order_by('pk').values_list('pk', 'user',
+                                                       'available',
+                                                       'sent',
+                                                       'accepted',
+                                                       'flagged')
+        snapshot = cls()
+        last_pk = None
+        while True:
+            chunk = queryset
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            chunk = list(chunk[:chunk_size])
+            for pk, user_id, available, sent, accepted, flagged in chunk:
+                snapshot.user_ids.append(user_id)
+                snapshot.available.append(available)
+                snapshot.sent.append(sent)
+                snapshot.accepted.append(accepted)
+                snapshot.flagged.append(flagged)
+            if len(chunk) < chunk_size:
+                return snapshot
+            last_pk = chunk[-1][0]
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def scores(self):
+        """
+        Return performance scores in the order of ``user_ids``.
+
+        A custom ``INVITATION_PERFORMANCE_FUNC`` is called for each inviter
+        with an unsaved ``InvitationStats`` instance.
+        """
+        if app_settings.PERFORMANCE_FUNC:
+            return array('d', (app_settings.PERFORMANCE_FUNC(
+                                      InvitationStats(user_id=user_id,
+                                                      available=available,
+                                                      sent=sent,
+                                                      accepted=accepted,
+                                                      flagged=flagged))
+                               for user_id, available, sent, accepted,
+                                   flagged in \
+                                   izip(self.user_ids, self.available,
+                                        self.sent, self.accepted,
+                                        self.flagged)))
+        if numpy is not None:
+            return self._numpy_scores()
+        performance = DEFAULT_PERFORMANCE_CALCULATORS[app_settings.INVITE_ONLY]
+        return array('d', (performance(StatsRow(*row)) for row in \
+                               izip(self.available, self.sent, self.accepted,
+                                    self.flagged)))
+
+    def _numpy_scores(self):
+        # Same calculations as the default performance calculators
+        # in invitation.models, applied to whole columns.
+        available = numpy.array(self.available, dtype=float)
+        sent = numpy.array(self.sent, dtype=float)
+        accepted = numpy.array(self.accepted, dtype=float) - \
+                   numpy.array(self.flagged, dtype=float)
+        scores = numpy.minimum(ratio(accepted, sent), 1.0)
+        if app_settings.INVITE_ONLY:
+            send_ratio = ratio(sent, available + sent)
+            scores = numpy.minimum((send_ratio + scores) * 0.6, 1.0)
+        return scores
+
+    def top(self, k):
+        """
+        Return ``(score, user_id)`` tuples of ``k`` best performing users,
+        best first.
+        """
+        return heapq.nlargest(k, izip(self.scores(), self.user_ids))
+
+    def above(self, threshold):
+        """
+        Return ids of users with performance ``threshold`` or higher.
+        """
+        return [user_id for score, user_id in izip(self.scores(),
+                                                    self.user_ids) \
+                if score >= threshold]
@@ -0,0 +1,2 @@
+CREATE INDEX invitation_invitation_user_id_date_invited_id
+    ON invitation_invitation (user_id, date_invited, id);
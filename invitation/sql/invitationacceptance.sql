@@ -0,0 +1,2 @@
+CREATE INDEX invitation_invitationacceptance_inviter_id_date_invited
+    ON invitation_invitationacceptance (inviter_id, date_invited);
@@ -1,5 +1,5 @@
 from django import template
-from invitation.app_settings import INVITE_ONLY
+from invitation import app_settings
 
 
 register = template.Library()
@@ -14,4 +14,4 @@ def admin_reward_link():
 
         {% admin_reward_link %}
     """
-    return {'INVITE_ONLY': INVITE_ONLY}
+    return {'INVITE_ONLY': app_settings.INVITE_ONLY}
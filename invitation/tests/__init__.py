@@ -1,5 +1,20 @@
 from views import InviteOnlyModeTestCase
 from views import InviteOptionalModeTestCase
 from models import InvitationTestCase
+from models import InvitationAcceptanceTestCase
+from models import ArchivedInvitationTestCase
+from models import InviteTreeNodeTestCase
 from models import InvitationStatsInviteOnlyTestCase
 from models import InvitationStatsInviteOptionalTestCase
+from dashboard import DashboardTestCase
+from api import ApiTestCase
+from services import InvitationServiceTestCase
+from services import InvitationServiceTransactionTestCase
+from conf import AppSettingsTestCase
+from routers import InvitationRouterTestCase
+from routers import ReplicaRoutingTestCase
+from snapshot import StatsSnapshotTestCase
+from domains import DomainValidationTestCase
+from bounces import BounceTestCase
+from signals import SignalBatchingTestCase
+from fraud import FraudTestCase
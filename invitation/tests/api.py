@@ -0,0 +1,65 @@
+from django.core import mail
+from django.core.urlresolvers import reverse
+from django.utils import simplejson
+from django.contrib.auth.models import User
+from utils import BaseTestCase
+from invitation.models import Invitation
+
+
+class ApiTestCase(BaseTestCase):
+    urls = 'invitation.tests.urls'
+
+    def post_json(self, url, data):
+        response = self.client.post(url,
+                                    simplejson.dumps(data),
+                                    content_type='application/json')
+        return response, simplejson.loads(response.content)
+
+    def test_invite(self):
+        url = reverse('invitation_api_invite')
+        response, data = self.post_json(url, {'emails': []})
+        self.assertEqual(response.status_code, 401)
+        self.client.login(username='testuser', password='testuser')
+        response, data = self.post_json(url, {'emails': 'a@example.com'})
+        self.assertEqual(response.status_code, 400)
+        Invitation.objects.invite(self.user(), 'old@example.com')
+        response, data = self.post_json(url, {'emails': ['new@example.com',
+                                                         'old@example.com',
+                                                         'new@example.com',
+                                                         'not an email']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in data['results']],
+                         ['invited', 'existing', 'duplicate', 'invalid'])
+        self.assertEqual(Invitation.objects.count(), 2)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(self.user().invitation_stats.sent, 2)
+
+    def test_key_and_accept(self):
+        invitation = Invitation.objects.invite(self.user(),
+                                               'friend@example.com')
+        key_url = reverse('invitation_api_key', args=(invitation.key,))
+        response = self.client.post(key_url)
+        self.assertEqual(response.status_code, 405)
+        response = self.client.get(key_url)
+        data = simplejson.loads(response.content)
+        self.assertEqual(data['valid'], True)
+        self.assertEqual(data['email'], 'friend@example.com')
+        accept_url = reverse('invitation_api_accept', args=(invitation.key,))
+        response, data = self.post_json(accept_url, {'username': 'friend'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual('password1' in data['errors'], True)
+        # The invited email is used, it isn't required in the request
+        self.assertEqual('email' in data['errors'], False)
+        response, data = self.post_json(accept_url, {'username': 'friend',
+                                                     'password1': 'friend',
+                                                     'password2': 'friend'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(User.objects.get(username='friend').email,
+                         'friend@example.com')
+        self.assertEqual(self.user().invitation_stats.accepted, 1)
+        response = self.client.get(key_url)
+        self.assertEqual(response.status_code, 404)
+        response, data = self.post_json(accept_url, {'username': 'other',
+                                                     'password1': 'other',
+                                                     'password2': 'other'})
+        self.assertEqual(response.status_code, 404)
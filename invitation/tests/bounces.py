@@ -0,0 +1,96 @@
+import email
+from django.contrib.auth.models import User
+from utils import BaseTestCase
+from invitation import app_settings
+from invitation.bounces import bounced_addresses, ingest
+from invitation.models import InvitationError, Invitation, SuppressedEmail
+
+
+DSN = """\
+From: MAILER-DAEMON@example.com
+To: invitations@example.com
+Subject: Undelivered Mail Returned to Sender
+MIME-Version: 1.0
+Content-Type: multipart/report; report-type=delivery-status; boundary="B"
+
+--B
+Content-Type: text/plain
+
+Delivery failed.
+
+--B
+Content-Type: message/delivery-status
+
+Reporting-MTA: dns; mail.example.com
+
+Final-Recipient: rfc822; gone@example.com
+Action: failed
+Status: 5.1.1
+
+Final-Recipient: rfc822; late@example.com
+Action: delayed
+Status: 4.4.1
+
+--B--
+"""
+
+
+class BounceTestCase(BaseTestCase):
+    def setUp(self):
+        super(BounceTestCase, self).setUp()
+        app_settings.INVITE_ONLY = True
+
+    def test_bounced_addresses(self):
+        message = email.message_from_string(DSN)
+        self.assertEqual(list(bounced_addresses(message)),
+                         ['gone@example.com'])
+
+    def test_ingest(self):
+        stats = self.user().invitation_stats
+        available, sent = stats.available, stats.sent
+        Invitation.objects.invite(self.user(), 'gone@example.com')
+        Invitation.objects.invite(self.user(), 'friend@example.com')
+        self.assertEqual(ingest(['Gone@example.com', 'never@example.com'],
+                                batch_size=1),
+                         (1, 2))
+        self.assertEqual(Invitation.objects.get(
+                                         email='gone@example.com').bounced,
+                         True)
+        stats = self.user().invitation_stats
+        self.assertEqual((stats.available, stats.sent),
+                         (available - 1, sent + 1))
+        self.assertEqual(SuppressedEmail.objects.count(), 2)
+        self.assertRaises(InvitationError,
+                          Invitation.objects.invite,
+                          self.user(),
+                          'never@example.com')
+        result = Invitation.objects.invite_many(self.user(),
+                                                ['never@example.com',
+                                                 'new@example.com'])
+        self.assertEqual([(e, i is None) for e, i, created in result],
+                         [('never@example.com', True),
+                          ('new@example.com', False)])
+
+    def test_bounce_then_accept(self):
+        invitation = Invitation.objects.invite(self.user(), 'gone@example.com')
+        Invitation.objects.lookup(invitation.key)
+        stats = self.user().invitation_stats
+        self.assertEqual(Invitation.objects.mark_bounced(['gone@example.com']),
+                         1)
+        invitation = Invitation.objects.get(pk=invitation.pk)
+        self.assertEqual(invitation.is_valid(), False)
+        self.assertRaises(Invitation.DoesNotExist,
+                          Invitation.objects.find, invitation.key)
+        self.assertEqual(Invitation.objects.lookup(invitation.key), None)
+        self.assertEqual(Invitation.objects.valid().filter(
+                                              pk=invitation.pk).count(), 0)
+        self.assertEqual(Invitation.objects.claim(invitation), False)
+        new_user = User.objects.create_user('gone', 'gone@example.com', 'gone')
+        self.assertRaises(InvitationError, invitation.mark_accepted, new_user)
+        # The bounced invitation is kept and the refund isn't undone
+        self.assertEqual(Invitation.objects.filter(pk=invitation.pk).count(),
+                         1)
+        refunded = self.user().invitation_stats
+        self.assertEqual((refunded.available, refunded.sent,
+                          refunded.accepted),
+                         (stats.available + 1, stats.sent - 1, stats.accepted))
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.test import TestCase
+from invitation import app_settings
+from invitation.models import performance_calculator_invite_optional
+
+
+MISSING = object()
+CHANGED_SETTINGS = ('INVITATION_EXPIRE_DAYS', 'INVITATION_PERFORMANCE_FUNC')
+
+
+class AppSettingsTestCase(TestCase):
+    def setUp(self):
+        self.overrides = dict(app_settings.__dict__)
+        self.old_settings = dict((name, getattr(settings, name, MISSING))
+                                 for name in CHANGED_SETTINGS)
+
+    def tearDown(self):
+        for name, value in self.old_settings.items():
+            if value is MISSING:
+                if hasattr(settings, name):
+                    delattr(settings, name)
+            else:
+                setattr(settings, name, value)
+        app_settings.reset()
+        app_settings.__dict__.update(self.overrides)
+
+    def test_lazy_evaluation(self):
+        settings.INVITATION_EXPIRE_DAYS = 3
+        app_settings.reset()
+        self.assertEqual('EXPIRE_DAYS' in app_settings.__dict__, False)
+        self.assertEqual(app_settings.EXPIRE_DAYS, 3)
+        settings.INVITATION_EXPIRE_DAYS = 5
+        # Cached until reset
+        self.assertEqual(app_settings.EXPIRE_DAYS, 3)
+        app_settings.reset()
+        self.assertEqual(app_settings.EXPIRE_DAYS, 5)
+        self.assertRaises(AttributeError, getattr, app_settings, 'UNKNOWN')
+
+    def test_performance_func(self):
+        settings.INVITATION_PERFORMANCE_FUNC = \
+                  'invitation.models.performance_calculator_invite_optional'
+        app_settings.reset()
+        self.assertEqual(app_settings.PERFORMANCE_FUNC,
+                         performance_calculator_invite_optional)
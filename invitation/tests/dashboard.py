@@ -0,0 +1,37 @@
+from django.core.cache import cache
+from utils import BaseTestCase
+from invitation import app_settings
+from invitation.dashboard import CACHE_KEY, build_dashboard, get_dashboard
+from invitation.dashboard import refresh_dashboard
+from invitation.models import Invitation
+
+
+class DashboardTestCase(BaseTestCase):
+    def setUp(self):
+        super(DashboardTestCase, self).setUp()
+        cache.delete(CACHE_KEY)
+
+    def test_build_dashboard(self):
+        Invitation.objects.invite(self.user(), u'friend@example.com')
+        dashboard = build_dashboard()
+        self.assertEqual(dashboard['totals']['sent'], 1)
+        self.assertEqual(dashboard['totals']['accepted'], 0)
+        self.assertAlmostEqual(dashboard['totals']['conversion'], 0.0)
+        self.assertEqual(dashboard['expiring_soon'], 0)
+        self.assertEqual(dashboard['top_inviters'][0]['username'],
+                         u'testuser')
+        dashboard = build_dashboard(
+                               expiring_days=app_settings.EXPIRE_DAYS + 1)
+        self.assertEqual(dashboard['expiring_soon'], 1)
+
+    def test_get_dashboard(self):
+        # Figures are never calculated on read
+        self.assertEqual(get_dashboard(), None)
+        dashboard = refresh_dashboard()
+        Invitation.objects.invite(self.user(), u'friend@example.com')
+        self.assertEqual(get_dashboard()['totals']['sent'],
+                         dashboard['totals']['sent'])
+        self.assertEqual(refresh_dashboard()['totals']['sent'],
+                         dashboard['totals']['sent'] + 1)
+        self.assertEqual(get_dashboard()['totals']['sent'],
+                         dashboard['totals']['sent'] + 1)
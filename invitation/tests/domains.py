@@ -0,0 +1,43 @@
+from django.core.cache import cache
+from django.test import TestCase
+from invitation import app_settings
+from invitation.domains import StubResolver, cache_key
+from invitation.domains import is_valid_domain, validate_domains
+from invitation.forms import InvitationForm
+
+
+class DomainValidationTestCase(TestCase):
+    domains = ('example.com', 'example.org', 'dead.example')
+
+    def setUp(self):
+        for domain in self.domains:
+            cache.delete(cache_key(domain))
+
+    def test_is_valid_domain(self):
+        resolver = StubResolver(['example.com'])
+        self.assertEqual(is_valid_domain('Example.com', resolver), True)
+        self.assertEqual(is_valid_domain('dead.example', resolver), False)
+        # Results are cached, including negative ones
+        resolver = StubResolver(['dead.example'])
+        self.assertEqual(is_valid_domain('example.com', resolver), True)
+        self.assertEqual(is_valid_domain('dead.example', resolver), False)
+
+    def test_validate_domains(self):
+        resolver = StubResolver(['example.com', 'example.org'])
+        self.assertEqual(validate_domains(self.domains, resolver),
+                         {'example.com': True,
+                          'example.org': True,
+                          'dead.example': False})
+
+    def test_form(self):
+        app_settings.VALIDATE_DOMAINS = True
+        app_settings.DOMAIN_RESOLVER = 'invitation.domains.StubResolver'
+        try:
+            form = InvitationForm({'email': 'friend@example.com'})
+            self.assertEqual(form.is_valid(), False)
+            cache.set(cache_key('example.com'), True)
+            form = InvitationForm({'email': 'friend@example.com'})
+            self.assertEqual(form.is_valid(), True)
+        finally:
+            del app_settings.VALIDATE_DOMAINS
+            del app_settings.DOMAIN_RESOLVER
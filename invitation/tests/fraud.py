@@ -0,0 +1,114 @@
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.http import HttpRequest
+from django.contrib.auth.models import User
+from utils import BaseTestCase
+from invitation import app_settings
+from invitation.fraud import burst_cache_key
+from invitation.models import Invitation, InvitationAcceptance
+from invitation.models import InvitationStats
+from invitation.snapshot import StatsSnapshot
+
+
+class FraudTestCase(BaseTestCase):
+    urls = 'invitation.tests.urls'
+
+    def setUp(self):
+        super(FraudTestCase, self).setUp()
+        app_settings.INVITE_ONLY = False
+        cache.delete(burst_cache_key(self.user().pk,
+                                     app_settings.FRAUD_BURST_WINDOW))
+
+    def tearDown(self):
+        del app_settings.INVITE_ONLY
+        del app_settings.FRAUD_CHECKS
+        super(FraudTestCase, self).tearDown()
+
+    def accept(self, username, email=None, ip=None):
+        invitation = Invitation.objects.invite(
+                            self.user(),
+                            email or '%s@example.com' % username,
+                            ip='10.0.0.1')
+        new_user = User.objects.create_user(username,
+                                            invitation.email,
+                                            username)
+        request = HttpRequest()
+        request.META['REMOTE_ADDR'] = ip or '10.0.0.2'
+        invitation.mark_accepted(new_user, request)
+        return InvitationAcceptance.objects.get(invitee=new_user)
+
+    def test_no_checks(self):
+        app_settings.FRAUD_CHECKS = ()
+        acceptance = self.accept('friend', ip='10.0.0.1')
+        self.assertEqual(acceptance.suspect, False)
+        self.assertEqual(self.user().invitation_stats.flagged, 0)
+
+    def test_same_ip(self):
+        app_settings.FRAUD_CHECKS = ('invitation.fraud.same_ip',)
+        self.assertEqual(self.accept('friend').suspect, False)
+        acceptance = self.accept('sockpuppet', ip='10.0.0.1')
+        self.assertEqual(acceptance.suspect, True)
+        self.assertEqual(acceptance.reasons, 'same_ip')
+        stats = self.user().invitation_stats
+        self.assertEqual((stats.sent, stats.accepted, stats.flagged),
+                         (2, 2, 1))
+        self.assertEqual(stats.performance, 0.5)
+
+    def test_burst(self):
+        app_settings.FRAUD_CHECKS = ('invitation.fraud.burst',)
+        app_settings.FRAUD_BURST_LIMIT = 2
+        try:
+            self.assertEqual(self.accept('first').suspect, False)
+            self.assertEqual(self.accept('second').suspect, False)
+            self.assertEqual(self.accept('third').reasons, 'burst')
+        finally:
+            del app_settings.FRAUD_BURST_LIMIT
+
+    def test_disposable_domain(self):
+        app_settings.FRAUD_CHECKS = ('invitation.fraud.disposable_domain',
+                                     'invitation.fraud.same_ip')
+        app_settings.DISPOSABLE_DOMAINS = ('mailinator.com',)
+        try:
+            acceptance = self.accept('friend', 'friend@Mailinator.com',
+                                     ip='10.0.0.1')
+        finally:
+            del app_settings.DISPOSABLE_DOMAINS
+        self.assertEqual(acceptance.reasons, 'disposable_domain same_ip')
+
+    def test_ipv6(self):
+        app_settings.FRAUD_CHECKS = ('invitation.fraud.same_ip',)
+        ip = '2001:db8:85a3:8d3:1319:8a2e:370:7348'
+        invitation = Invitation.objects.invite(self.user(),
+                                               'friend@example.com',
+                                               ip=ip)
+        self.assertEqual(Invitation.objects.get(pk=invitation.pk).inviter_ip,
+                         ip)
+
+    def test_snapshot_excludes_flagged(self):
+        app_settings.FRAUD_CHECKS = ('invitation.fraud.same_ip',)
+        self.accept('friend')
+        self.accept('sockpuppet', ip='10.0.0.1')
+        snapshot = StatsSnapshot.load(InvitationStats.objects.filter(
+                                                        user=self.user()))
+        self.assertEqual(list(snapshot.flagged), [1])
+        self.assertAlmostEqual(snapshot.scores()[0], 0.5)
+
+    def test_views(self):
+        app_settings.FRAUD_CHECKS = ('invitation.fraud.same_ip',)
+        self.client.login(username='testuser', password='testuser')
+        self.client.post(reverse('invitation_invite'),
+                         {'email': 'friend@example.com'})
+        invitation = Invitation.objects.get(email='friend@example.com')
+        self.assertEqual(invitation.inviter_ip, '127.0.0.1')
+        self.client.logout()
+        response = self.client.post(reverse('invitation_register',
+                                            args=(invitation.key,)),
+                                    {'username': 'friend',
+                                     'email': 'friend@example.com',
+                                     'password1': 'friend',
+                                     'password2': 'friend'})
+        self.assertRedirects(response, reverse('invitation_registered'))
+        acceptance = InvitationAcceptance.objects.get(
+                                             invitee__username='friend')
+        self.assertEqual(acceptance.suspect, True)
+        self.assertEqual(self.user().invitation_stats.flagged, 1)
@@ -1,9 +1,19 @@
 import datetime
+import os
+import shutil
+import tempfile
+from django.conf import settings
 from django.core import mail
+from django.db import connection
+from django.contrib.sites.models import Site
 from django.contrib.auth.models import User
 from utils import BaseTestCase
 from invitation import app_settings
 from invitation.models import InvitationError, Invitation, InvitationStats
+from invitation.models import normalize_email
+from invitation.models import InvitationAcceptance, InvitationRollup
+from invitation.models import ArchivedInvitation, InviteTreeNode
+from invitation.archive import JSONLinesArchive
 from invitation.models import performance_calculator_invite_only
 from invitation.models import performance_calculator_invite_optional
 
@@ -36,12 +46,54 @@ class InvitationTestCase(BaseTestCase):
         self.assertEqual(len(mail.outbox), 2)
         self.assertEqual(mail.outbox[1].recipients()[0], u'other@email.org')
 
+    def test_send_emails(self):
+        for i in range(4):
+            Invitation.objects.create(user=self.user(),
+                                      email=u'friend%d@example.com' % i,
+                                      key=u'%d' % i * 40)
+        invitations = list(Invitation.objects.all())
+        site = Site.objects.get_current()
+        debug = settings.DEBUG
+        settings.DEBUG = True
+        connection.queries = []
+        try:
+            self.assertEqual(Invitation.objects.send_emails(invitations,
+                                                            site), 5)
+            self.assertEqual(len(connection.queries), 1)
+        finally:
+            settings.DEBUG = debug
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(invitations[0].inviter_context,
+                         {'username': u'testuser', 'full_name': u''})
+
     def test_mark_accepted(self):
         new_user = User.objects.create_user('test', 'test@example.com', 'test')
         pk = self.invitation.pk
         self.invitation.mark_accepted(new_user)
         self.assertRaises(Invitation.DoesNotExist,
                           Invitation.objects.get, pk=pk)
+        self.assertEqual(self.user().invitation_stats.accepted, 1)
+        acceptance = InvitationAcceptance.objects.get(invitee=new_user)
+        self.assertEqual(acceptance.inviter, self.user())
+        self.assertEqual(acceptance.date_invited,
+                         self.invitation.date_invited)
+        node = InviteTreeNode.objects.get(user=new_user)
+        self.assertEqual(node.parent.user, self.user())
+        self.assertEqual(node.path, '%d/%d/' % (self.user().pk, new_user.pk))
+        self.assertEqual(node.depth, 1)
+        # A second acceptance of the same invitation must fail
+        # and leave the stats untouched.
+        self.assertRaises(InvitationError,
+                          self.invitation.mark_accepted, new_user)
+        self.assertEqual(self.user().invitation_stats.accepted, 1)
+
+    def test_claim(self):
+        invitation = self.make_invalid()
+        self.assertEqual(Invitation.objects.claim(invitation), False)
+        invitation.date_invited = datetime.datetime.now()
+        invitation.save()
+        self.assertEqual(Invitation.objects.claim(invitation), True)
+        self.assertEqual(Invitation.objects.claim(invitation), False)
 
     def test_invite(self):
         self.user().invitation_stats.add_available(10)
@@ -63,6 +115,76 @@ class InvitationTestCase(BaseTestCase):
         self.assertEqual(new_invitation.is_valid(), True)
         self.assertNotEqual(new_invitation, invitation)
 
+    def test_normalize_email(self):
+        self.assertEqual(normalize_email(u' John+News@Example.COM'),
+                         u'john+news@example.com')
+        app_settings.DEDUP_STRIP_PLUS_TAG = True
+        try:
+            self.assertEqual(normalize_email(u'John+News@Example.COM'),
+                             u'john@example.com')
+        finally:
+            app_settings.DEDUP_STRIP_PLUS_TAG = False
+
+    def test_normalize_emails(self):
+        Invitation.objects.create(user=self.user(),
+                                  email=u'Friend+tag@Example.com',
+                                  key=u'E' * 40)
+        Invitation.objects.update(normalized_email='')
+        self.assertEqual(Invitation.objects.normalize_emails(batch_size=1),
+                         2)
+        self.assertEqual(Invitation.objects.get(key=u'E' * 40) \
+                                           .normalized_email,
+                         u'friend+tag@example.com')
+        self.assertEqual(Invitation.objects.normalize_emails(), 0)
+        app_settings.DEDUP_STRIP_PLUS_TAG = True
+        try:
+            self.assertEqual(Invitation.objects.normalize_emails(
+                                                    only_missing=False), 1)
+        finally:
+            del app_settings.DEDUP_STRIP_PLUS_TAG
+        self.assertEqual(Invitation.objects.get(key=u'E' * 40) \
+                                           .normalized_email,
+                         u'friend@example.com')
+
+    def test_invite_global_dedup(self):
+        other_user = User.objects.create_user('other',
+                                              'other@example.com',
+                                              'other')
+        sent = other_user.invitation_stats.sent
+        app_settings.GLOBAL_DEDUP = True
+        try:
+            invitation = Invitation.objects.invite(other_user,
+                                                   u'Test@Example.com')
+        finally:
+            app_settings.GLOBAL_DEDUP = False
+        self.assertEqual(invitation, self.invitation)
+        self.assertEqual(invitation.user, self.user())
+        other_user = User.objects.get(pk=other_user.pk)
+        self.assertEqual(other_user.invitation_stats.sent, sent)
+        self.assertEqual(Invitation.objects.count(), 1)
+
+    def test_quota_windows(self):
+        app_settings.QUOTA_WINDOWS = ((3600, 3), (86400, 10))
+        try:
+            # setUp already sent an invitation
+            Invitation.objects.invite(self.user(), u'friend1@example.com')
+            self.assertRaises(InvitationError,
+                              Invitation.objects.invite_many,
+                              self.user(),
+                              [u'friend2@example.com', u'friend3@example.com'])
+            Invitation.objects.invite(self.user(), u'friend2@example.com')
+            self.assertRaises(InvitationError,
+                              Invitation.objects.invite,
+                              self.user(),
+                              u'friend3@example.com')
+            # Invitations older than the window don't count
+            Invitation.objects.update(date_invited=datetime.datetime.now() - \
+                                                  datetime.timedelta(hours=2))
+            Invitation.objects.invite(self.user(), u'friend3@example.com')
+        finally:
+            app_settings.QUOTA_WINDOWS = ()
+        self.assertEqual(Invitation.objects.count(), 4)
+
     def test_find(self):
         self.assertEqual(Invitation.objects.find(self.invitation.key),
                          self.invitation)
@@ -75,6 +197,156 @@ class InvitationTestCase(BaseTestCase):
                           Invitation.objects.find, '')
 
 
+class ArchivedInvitationTestCase(BaseTestCase):
+    def setUp(self):
+        super(ArchivedInvitationTestCase, self).setUp()
+        now = datetime.datetime.now()
+        for days in (1, 100, 200):
+            Invitation.objects.create(user=self.user(),
+                                      email=u'%s@example.com' % days,
+                                      key=u'%040d' % days,
+                                      date_invited=now - \
+                                                   datetime.timedelta(days))
+        Invitation.objects.filter(key=u'%040d' % 100).update(bounced=True)
+        self.before = now - datetime.timedelta(50)
+
+    def test_archive_and_restore(self):
+        self.assertEqual(Invitation.objects.archive(self.before,
+                                                    batch_size=1), 2)
+        self.assertEqual(Invitation.objects.count(), 1)
+        self.assertEqual(ArchivedInvitation.objects.count(), 2)
+        self.assertEqual(ArchivedInvitation.objects.restore(
+                                 datetime.datetime.now() - \
+                                 datetime.timedelta(150)), 1)
+        self.assertEqual(ArchivedInvitation.objects.restore(), 1)
+        self.assertEqual(ArchivedInvitation.objects.count(), 0)
+        self.assertEqual(Invitation.objects.count(), 3)
+        self.assertEqual(Invitation.objects.get(key=u'%040d' % 200).email,
+                         u'200@example.com')
+        self.assertEqual(Invitation.objects.get(key=u'%040d' % 100).bounced,
+                         True)
+        self.assertEqual(Invitation.objects.get(key=u'%040d' % 200).bounced,
+                         False)
+
+    def test_json_lines_archive(self):
+        directory = tempfile.mkdtemp()
+        try:
+            archive = JSONLinesArchive(os.path.join(directory,
+                                                    'archive.jsonl.gz'))
+            self.assertEqual(Invitation.objects.archive(self.before,
+                                                        store=archive.store),
+                             2)
+            self.assertEqual(ArchivedInvitation.objects.count(), 0)
+            self.assertEqual(Invitation.objects.restore(archive), 2)
+            self.assertEqual(Invitation.objects.get(key=u'%040d' % 100) \
+                                               .bounced,
+                             True)
+            self.assertEqual(Invitation.objects.restore(archive), 0)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(Invitation.objects.count(), 3)
+
+
+class InvitationAcceptanceTestCase(BaseTestCase):
+    def accept(self, username, date_accepted):
+        new_user = User.objects.create_user(username,
+                                            '%s@example.com' % username,
+                                            username)
+        return InvitationAcceptance.objects.create(
+                                        inviter=self.user(),
+                                        invitee=new_user,
+                                        date_invited=date_accepted,
+                                        date_accepted=date_accepted)
+
+    def test_between(self):
+        now = datetime.datetime.now()
+        self.accept('first', now - datetime.timedelta(3))
+        self.accept('second', now - datetime.timedelta(1))
+        self.assertEqual(InvitationAcceptance.objects.between(
+                                  now - datetime.timedelta(2), now).count(), 1)
+        self.assertEqual(InvitationAcceptance.objects.between(
+                                  now - datetime.timedelta(4), now).count(), 2)
+
+    def test_rollup(self):
+        today = datetime.date.today()
+        noon = datetime.datetime.combine(today, datetime.time(12))
+        self.accept('first', noon)
+        self.accept('second', noon)
+        self.accept('third', noon - datetime.timedelta(1))
+        self.assertEqual(InvitationRollup.objects.rollup(today), 1)
+        rollup = InvitationRollup.objects.get(date=today)
+        self.assertEqual(rollup.inviter, self.user())
+        self.assertEqual(rollup.accepted, 2)
+        # Rolling up again replaces existing aggregates
+        self.assertEqual(InvitationRollup.objects.rollup(today), 1)
+        self.assertEqual(InvitationRollup.objects.filter(date=today).count(),
+                         1)
+
+
+class InviteTreeNodeTestCase(BaseTestCase):
+    def setUp(self):
+        super(InviteTreeNodeTestCase, self).setUp()
+        # testuser -> a -> b -> c, testuser -> d, other -> e
+        self.users = {}
+        for username in ('a', 'b', 'c', 'd', 'other', 'e'):
+            self.users[username] = User.objects.create_user(
+                                        username,
+                                        '%s@example.com' % username,
+                                        username)
+        self.users['testuser'] = self.user()
+        self.edges = (('testuser', 'a'), ('a', 'b'), ('b', 'c'),
+                      ('testuser', 'd'), ('other', 'e'))
+        now = datetime.datetime.now()
+        for i, (inviter, invitee) in enumerate(self.edges):
+            date = now + datetime.timedelta(seconds=i)
+            InvitationAcceptance.objects.create(
+                                        inviter=self.users[inviter],
+                                        invitee=self.users[invitee],
+                                        date_invited=date,
+                                        date_accepted=date)
+
+    def usernames(self, queryset):
+        return sorted(queryset.values_list('user__username', flat=True))
+
+    def check_tree(self):
+        root = InviteTreeNode.objects.get(user=self.users['testuser'])
+        self.assertEqual(root.depth, 0)
+        self.assertEqual(root.parent, None)
+        self.assertEqual(self.usernames(root.descendants()),
+                         ['a', 'b', 'c', 'd'])
+        self.assertEqual(self.usernames(root.descendants(1)), ['a', 'd'])
+        self.assertEqual(InviteTreeNode.objects.depth_counts(root),
+                         {1: 2, 2: 1, 3: 1})
+        node = InviteTreeNode.objects.get(user=self.users['b'])
+        self.assertEqual(self.usernames(node.descendants()), ['c'])
+        self.assertEqual(node.depth, 2)
+
+    def test_add(self):
+        for inviter, invitee in self.edges:
+            InviteTreeNode.objects.add(self.users[inviter],
+                                       self.users[invitee])
+        self.check_tree()
+
+    def test_path_overflow(self):
+        root = InviteTreeNode.objects.node_for(self.users['testuser'])
+        root.path = '1/' * 127
+        root.save()
+        node = InviteTreeNode.objects.add(self.users['testuser'],
+                                          self.users['a'])
+        self.assertEqual(node.path, None)
+        self.assertEqual(node.depth, 1)
+        node = InviteTreeNode.objects.add(self.users['a'], self.users['b'])
+        self.assertEqual(node.path, None)
+        self.assertEqual(node.parent.user, self.users['a'])
+        self.assertEqual(node.depth, 2)
+        self.assertEqual(list(node.parent.descendants()), [])
+
+    def test_rebuild(self):
+        InviteTreeNode.objects.node_for(self.users['b'])
+        self.assertEqual(InviteTreeNode.objects.rebuild(), 7)
+        self.check_tree()
+
+
 class InvitationStatsBaseTestCase(BaseTestCase):
     def stats(self, user=None):
         user = user or self.user()
@@ -83,10 +355,11 @@ class InvitationStatsBaseTestCase(BaseTestCase):
                 user.invitation_stats.accepted)
 
     class MockInvitationStats(object):
-        def __init__(self, available, sent, accepted):
+        def __init__(self, available, sent, accepted, flagged=0):
             self.available = available
             self.sent = sent
             self.accepted = accepted
+            self.flagged = flagged
 
 
 class InvitationStatsInviteOnlyTestCase(InvitationStatsBaseTestCase):
@@ -120,6 +393,14 @@ class InvitationStatsInviteOnlyTestCase(InvitationStatsBaseTestCase):
                           self.user().invitation_stats.use,
                           INITIAL_INVITATIONS + 5)
 
+    def test_use_stale(self):
+        stats = self.user().invitation_stats
+        stale = self.user().invitation_stats
+        stats.use(INITIAL_INVITATIONS)
+        # A stale instance can't overdraw available invitations
+        self.assertRaises(InvitationError, stale.use)
+        self.assertEqual(self.stats(), (0, INITIAL_INVITATIONS, 0))
+
     def test_mark_accepted(self):
         if INITIAL_INVITATIONS < 10:
             i = 10
@@ -0,0 +1,106 @@
+from unittest import skipUnless
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import router
+from django.http import HttpRequest, HttpResponse
+from django.test import TestCase
+from django.contrib.auth.models import User
+from utils import BaseTestCase
+from invitation import app_settings
+from invitation.models import InvitationError, Invitation, InvitationStats
+from invitation.routers import InvitationRouter, InvitationRouterMiddleware
+from invitation.routers import PIN_COOKIE, is_pinned, pin, unpin
+
+
+class InvitationRouterTestCase(TestCase):
+    def setUp(self):
+        self.router = InvitationRouter()
+        app_settings.READ_DATABASE = 'replica'
+        unpin()
+
+    def tearDown(self):
+        del app_settings.READ_DATABASE
+        unpin()
+
+    def test_routing(self):
+        self.assertEqual(self.router.db_for_read(User), None)
+        self.assertEqual(self.router.db_for_write(User), None)
+        self.assertEqual(is_pinned(), False)
+        self.assertEqual(self.router.db_for_read(Invitation), 'replica')
+        self.assertEqual(self.router.db_for_write(Invitation), 'default')
+        # Reads after a write go to the write database
+        self.assertEqual(is_pinned(), True)
+        self.assertEqual(self.router.db_for_read(Invitation), 'default')
+
+    def test_manager_options(self):
+        self.assertEqual(Invitation.objects.on_primary().db, 'default')
+        self.assertEqual(Invitation.objects.on_replica().db, 'replica')
+        self.assertEqual(is_pinned(), False)
+
+    def test_middleware(self):
+        middleware = InvitationRouterMiddleware()
+        request = HttpRequest()
+        middleware.process_request(request)
+        self.router.db_for_write(Invitation)
+        response = middleware.process_response(request, HttpResponse())
+        self.assertEqual(PIN_COOKIE in response.cookies, True)
+        request = HttpRequest()
+        middleware.process_request(request)
+        self.assertEqual(is_pinned(), False)
+        request.COOKIES[PIN_COOKIE] = '1'
+        middleware.process_request(request)
+        self.assertEqual(is_pinned(), True)
+
+    def test_unpin(self):
+        pin()
+        request_started.send(sender=self.__class__)
+        self.assertEqual(is_pinned(), False)
+
+
+@skipUnless('replica' in settings.DATABASES,
+            'Requires a second database with "replica" alias, e.g. another '
+            'SQLite database.')
+class ReplicaRoutingTestCase(BaseTestCase):
+    """
+    Route reads to a real second database, which never receives any
+    writes, like a replica lagging infinitely behind.
+    """
+    multi_db = True
+
+    def setUp(self):
+        super(ReplicaRoutingTestCase, self).setUp()
+        self.routers = router.routers
+        router.routers = [InvitationRouter()]
+        app_settings.READ_DATABASE = 'replica'
+        unpin()
+
+    def tearDown(self):
+        router.routers = self.routers
+        del app_settings.READ_DATABASE
+        unpin()
+        super(ReplicaRoutingTestCase, self).tearDown()
+
+    def test_read_your_writes(self):
+        invitation = Invitation.objects.invite(self.user(),
+                                               u'friend@example.com')
+        self.assertEqual(Invitation.objects.find(invitation.key), invitation)
+        unpin()
+        self.assertRaises(Invitation.DoesNotExist,
+                          Invitation.objects.find, invitation.key)
+        self.assertEqual(Invitation.objects.on_primary().count(), 1)
+
+    def test_invite_reads_primary(self):
+        app_settings.INVITE_ONLY = True
+        try:
+            InvitationStats.objects.filter(user=self.user()) \
+                                   .update(available=0)
+            # Stale stats on the replica
+            InvitationStats(user_id=self.user().pk,
+                            available=10).save(using='replica')
+            unpin()
+            self.assertRaises(InvitationError,
+                              Invitation.objects.invite,
+                              self.user(), u'friend@example.com')
+        finally:
+            del app_settings.INVITE_ONLY
+        self.assertEqual(Invitation.objects.on_primary().count(), 0)
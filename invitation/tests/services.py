@@ -0,0 +1,81 @@
+from unittest import skipUnless
+from django.core import mail
+from django.db import connection
+from django.test import TransactionTestCase
+from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from utils import BaseTestCase
+from invitation.models import InvitationError, Invitation, InvitationStats
+from invitation.routers import is_pinned
+from invitation.services import InvitationService
+
+
+def shares_database_across_threads():
+    settings_dict = connection.settings_dict
+    return not (settings_dict['ENGINE'].endswith('sqlite3') and
+                settings_dict.get('TEST_NAME') in (None, '', ':memory:'))
+
+
+class InvitationServiceTestCase(BaseTestCase):
+    def test_send_emails(self):
+        # Worker threads don't share the test transaction,
+        # so only database independent operations are tested.
+        invitations = [Invitation(user=self.user(),
+                                  email=u'friend%d@example.com' % i,
+                                  key=u'%040d' % i) for i in range(5)]
+        service = InvitationService(
+                 workers=2,
+                 email_backend='django.core.mail.backends.locmem.EmailBackend')
+        results = service.send_emails(invitations,
+                                      site=Site(domain='example.com'),
+                                      chunk_size=2)
+        service.close()
+        self.assertEqual([result.get() for result in results], [2, 2, 1])
+        self.assertEqual(sorted(m.recipients()[0] for m in mail.outbox),
+                         [i.email for i in invitations])
+
+
+@skipUnless(shares_database_across_threads(),
+            'Worker threads can\'t share an in-memory SQLite database, set '
+            'TEST_NAME of the database.')
+class InvitationServiceTransactionTestCase(TransactionTestCase):
+    """
+    Run database operations in worker threads, which see only committed
+    data.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('testuser',
+                                             'testuser@example.com',
+                                             'testuser')
+        self.service = InvitationService(workers=2)
+
+    def tearDown(self):
+        self.service.close()
+
+    def test_invite_find_and_mark_accepted(self):
+        invitation = self.service.invite(self.user,
+                                         u'friend@example.com',
+                                         '10.0.0.1').get()
+        self.assertEqual(Invitation.objects.get(pk=invitation.pk).inviter_ip,
+                         '10.0.0.1')
+        self.assertEqual(self.service.find(invitation.key).get(), invitation)
+        self.assertRaises(Invitation.DoesNotExist,
+                          self.service.find(u'0' * 40).get)
+        new_user = User.objects.create_user('friend',
+                                            'friend@example.com',
+                                            'friend')
+        self.service.mark_accepted(invitation, new_user).get()
+        self.assertEqual(InvitationStats.objects.get(user=self.user).accepted,
+                         1)
+        self.assertRaises(InvitationError,
+                          self.service.mark_accepted(invitation,
+                                                     new_user).get)
+
+    def test_unpin(self):
+        service = InvitationService(workers=1)
+        try:
+            service.invite(self.user, u'friend@example.com').get()
+            # The worker thread reads from the replica again
+            self.assertEqual(service._apply(is_pinned).get(), False)
+        finally:
+            service.close()
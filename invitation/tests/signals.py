@@ -0,0 +1,42 @@
+from __future__ import with_statement
+from utils import BaseTestCase
+from invitation.models import InvitationStats
+from invitation.signals import invitation_added, invitation_batch
+from invitation.signals import batch_signals, suppress_signals
+
+
+class SignalBatchingTestCase(BaseTestCase):
+    def setUp(self):
+        super(SignalBatchingTestCase, self).setUp()
+        self.added = []
+        self.batches = []
+        invitation_added.connect(self.on_added)
+        invitation_batch.connect(self.on_batch, sender=invitation_added)
+
+    def tearDown(self):
+        invitation_added.disconnect(self.on_added)
+        invitation_batch.disconnect(self.on_batch, sender=invitation_added)
+        super(SignalBatchingTestCase, self).tearDown()
+
+    def on_added(self, sender, **kwargs):
+        self.added.append(kwargs['count'])
+
+    def on_batch(self, sender, sends, **kwargs):
+        self.batches.append([named['count'] for s, named in sends])
+
+    def test_batch_signals(self):
+        with batch_signals():
+            InvitationStats.objects.give_invitations(count=2)
+            with batch_signals():
+                InvitationStats.objects.give_invitations(count=3)
+            self.assertEqual(self.batches, [])
+        self.assertEqual(self.added, [])
+        self.assertEqual(self.batches, [[2, 3]])
+        InvitationStats.objects.give_invitations(count=1)
+        self.assertEqual(self.added, [1])
+
+    def test_suppress_signals(self):
+        with suppress_signals():
+            InvitationStats.objects.give_invitations(count=2)
+        self.assertEqual(self.added, [])
+        self.assertEqual(self.batches, [])
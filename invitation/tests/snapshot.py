@@ -0,0 +1,34 @@
+from django.contrib.auth.models import User
+from utils import BaseTestCase
+from invitation import app_settings
+from invitation.models import InvitationStats
+from invitation.snapshot import StatsSnapshot
+
+
+class StatsSnapshotTestCase(BaseTestCase):
+    def setUp(self):
+        super(StatsSnapshotTestCase, self).setUp()
+        app_settings.INVITE_ONLY = False
+        for username, sent, accepted in (('good', 10, 9),
+                                         ('poor', 10, 1)):
+            user = User.objects.create_user(username,
+                                            '%s@example.com' % username,
+                                            username)
+            InvitationStats.objects.filter(user=user).update(
+                                                 sent=sent, accepted=accepted)
+
+    def test_load(self):
+        snapshot = StatsSnapshot.load(chunk_size=2)
+        self.assertEqual(len(snapshot), 3)
+        self.assertEqual(sorted(snapshot.sent), [0, 10, 10])
+
+    def test_scores(self):
+        snapshot = StatsSnapshot.load()
+        scores = dict(zip(snapshot.user_ids, snapshot.scores()))
+        for stats in InvitationStats.objects.all():
+            self.assertAlmostEqual(scores[stats.user_id], stats.performance)
+        good = User.objects.get(username='good')
+        self.assertEqual([user_id for score, user_id in snapshot.top(1)],
+                         [good.pk])
+        self.assertEqual(snapshot.above(app_settings.REWARD_THRESHOLD),
+                         [good.pk])
@@ -1,12 +1,25 @@
+import datetime
 from django.core.urlresolvers import reverse
 from django.core import mail
+from django.utils import simplejson, translation
 from django.contrib.auth.models import User
 from utils import BaseTestCase
+from invitation import app_settings
+from invitation.forms import RegistrationFormInvitation
 from invitation.models import Invitation
+from invitation.views import registration_form_cache_key
 
 
 class InviteOnlyModeTestCase(BaseTestCase):
-    urls = 'invitation.tests.invite_only_urls'
+    urls = 'invitation.tests.urls'
+
+    def setUp(self):
+        super(InviteOnlyModeTestCase, self).setUp()
+        app_settings.INVITE_ONLY = True
+
+    def tearDown(self):
+        del app_settings.INVITE_ONLY
+        super(InviteOnlyModeTestCase, self).tearDown()
 
     def test_invation_mode(self):
         # Normal registration view should redirect
@@ -72,14 +85,25 @@ class InviteOnlyModeTestCase(BaseTestCase):
 
 
 class InviteOptionalModeTestCase(BaseTestCase):
-    urls = 'invitation.tests.invite_optional_urls'
+    urls = 'invitation.tests.urls'
+
+    def setUp(self):
+        super(InviteOptionalModeTestCase, self).setUp()
+        app_settings.INVITE_ONLY = False
+
+    def tearDown(self):
+        del app_settings.INVITE_ONLY
+        super(InviteOptionalModeTestCase, self).tearDown()
 
     def test_invation_mode(self):
-        # Normal registration view should work
+        # Project's registration view should work
         response = self.client.get(reverse('registration_register'))
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response,
                                 'registration/registration_register.html')
+        # Invite only pages are not available
+        response = self.client.get(reverse('invitation_invite_only'))
+        self.assertEqual(response.status_code, 404)
         # So as registration after invitation view
         response = self.client.get(reverse('invitation_register',
                                            args=('A' * 40,)))
@@ -97,3 +121,66 @@ class InviteOptionalModeTestCase(BaseTestCase):
         self.assertEqual(invitation_query.count(), 1)
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(self.user().invitation_stats.sent, 1)
+
+    def test_sent_invitations(self):
+        now = datetime.datetime.now()
+        for i in range(3):
+            invitation = Invitation.objects.invite(self.user(),
+                                                   'friend%d@example.com' % i)
+            invitation.date_invited = now - datetime.timedelta(hours=i)
+            invitation.save()
+        self.client.login(username='testuser', password='testuser')
+        response = self.client.get(reverse('invitation_sent_json'))
+        data = simplejson.loads(response.content)
+        self.assertEqual([i['email'] for i in data['invitations']],
+                         ['friend0@example.com',
+                          'friend1@example.com',
+                          'friend2@example.com'])
+        self.assertEqual(data['next_cursor'], None)
+        url = reverse('invitation_sent')
+        response = self.client.get(url)
+        self.assertTemplateUsed(response, 'invitation/invitation_list.html')
+        self.assertContains(response, 'friend2@example.com')
+        # Seek pages of two
+        page = Invitation.objects.sent_by(self.user(), limit=2)
+        self.assertEqual(len(page), 2)
+        after = (page[-1]['date_invited'], page[-1]['id'])
+        page = Invitation.objects.sent_by(self.user(), after, limit=2)
+        self.assertEqual([i['email'] for i in page], ['friend2@example.com'])
+
+    def test_static_page_etag(self):
+        url = reverse('invitation_registered')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual('max-age=%s' % app_settings.STATIC_PAGE_MAX_AGE in
+                         response['Cache-Control'], True)
+        response = self.client.get(url,
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_cached_registration_form(self):
+        app_settings.REGISTRATION_FORM_CACHE_TTL = 60
+        try:
+            for email in ('first@example.com', 'second&co@example.com'):
+                invitation = Invitation.objects.invite(self.user(), email)
+                response = self.client.get(reverse('invitation_register',
+                                                   args=(invitation.key,)))
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'Registration Form')
+                self.assertContains(response, email.replace('&', '&amp;'))
+        finally:
+            del app_settings.REGISTRATION_FORM_CACHE_TTL
+
+    def test_registration_form_cache_key(self):
+        key = registration_form_cache_key('registration/form.html',
+                                          RegistrationFormInvitation)
+        translation.activate('tr')
+        try:
+            self.assertNotEqual(registration_form_cache_key(
+                                    'registration/form.html',
+                                    RegistrationFormInvitation), key)
+        finally:
+            translation.deactivate()
+        self.assertEqual(registration_form_cache_key(
+                             'registration/form.html',
+                             RegistrationFormInvitation), key)
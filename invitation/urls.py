@@ -1,9 +1,23 @@
 from django.conf.urls.defaults import *
 from django.views.generic.simple import direct_to_template
+from django.core.urlresolvers import RegexURLPattern
 from django.contrib.auth.decorators import login_required
-from app_settings import INVITE_ONLY
+from decorators import cached_page, invite_only_required
+import app_settings
 
 
+class InviteOnlyURLPattern(RegexURLPattern):
+    """
+    URL pattern that matches only if ``INVITATION_INVITE_ONLY`` is ``True``,
+    the following patterns are tried otherwise. The setting is checked on
+    each request.
+    """
+    def resolve(self, path):
+        if app_settings.INVITE_ONLY:
+            return super(InviteOnlyURLPattern, self).resolve(path)
+
+
+direct_to_template = cached_page(direct_to_template)
 login_required_direct_to_template = login_required(direct_to_template)
 
 
@@ -30,20 +44,33 @@ urlpatterns = patterns('',
     url(r'^invitation/accept/(?P<invitation_key>\w+)/$',
         'invitation.views.register',
         name='invitation_register'),
+    url(r'^invitation/sent/$',
+        'invitation.views.sent_invitations',
+        name='invitation_sent'),
+    url(r'^invitation/sent/json/$',
+        'invitation.views.sent_invitations_json',
+        name='invitation_sent_json'),
+    url(r'^invitation/api/invite/$',
+        'invitation.api.invite',
+        name='invitation_api_invite'),
+    url(r'^invitation/api/key/(?P<invitation_key>\w+)/$',
+        'invitation.api.key',
+        name='invitation_api_key'),
+    url(r'^invitation/api/accept/(?P<invitation_key>\w+)/$',
+        'invitation.api.accept',
+        name='invitation_api_accept'),
+    url(r'^invitation/dashboard/$',
+        'invitation.views.dashboard',
+        name='invitation_dashboard'),
+    # Following views check INVITATION_INVITE_ONLY on each request
+    InviteOnlyURLPattern(r'^register/$',
+                         'invitation.views.invite_only_redirect'),
+    url(r'^invitation/invite_only/$',
+        invite_only_required(direct_to_template),
+        {'template': 'invitation/invite_only.html'},
+        name='invitation_invite_only'),
+    url(r'^invitation/reward/$',
+        'invitation.views.reward',
+        name='invitation_reward'),
 )
 
-
-if INVITE_ONLY:
-    urlpatterns += patterns('',
-        url(r'^register/$',
-            'django.views.generic.simple.redirect_to',
-            {'url': '../invitation/invite_only/', 'permanent': False},
-            name='registration_register'),
-        url(r'^invitation/invite_only/$',
-            direct_to_template,
-            {'template': 'invitation/invite_only.html'},
-            name='invitation_invite_only'),
-        url(r'^invitation/reward/$',
-            'invitation.views.reward',
-            name='invitation_reward'),
-    )
@@ -1,12 +1,25 @@
+import datetime
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
-from django.http import HttpResponseRedirect
-from django.template import RequestContext
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseRedirect
+from django.middleware.csrf import get_token
+from django.template import Context, RequestContext
+from django.template.loader import render_to_string
 from django.shortcuts import render_to_response
-from django.utils.translation import ugettext
+from django.utils import simplejson
+from django.utils.hashcompat import md5_constructor
+from django.utils.html import escape
+from django.utils.translation import get_language, ugettext
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from models import InvitationError, Invitation, InvitationStats
 from forms import InvitationForm, RegistrationFormInvitation
+from dashboard import get_dashboard
+from decorators import invite_only_required
+from fraud import get_ip
+import app_settings
 from registration.signals import user_registered
 
 
@@ -18,6 +31,103 @@ def apply_extra_context(context, extra_context=None):
     return context
 
 
+CURSOR_DATE_FORMAT = '%Y%m%d%H%M%S%f'
+EMAIL_PLACEHOLDER = 'email-placeholder@invitation.invalid'
+CSRF_TOKEN_PLACEHOLDER = 'csrf-token-placeholder'
+
+
+def registration_form_cache_key(template_name, form_class):
+    return 'invitation.registration_form.%s' % md5_constructor(
+               '%s:%s.%s:%s' % (template_name,
+                                form_class.__module__,
+                                form_class.__name__,
+                                get_language())).hexdigest()
+
+
+def render_cached_form(request, template_name, form_class, email):
+    """
+    Render registration form for ``email`` from a cached rendering.
+
+    The template is rendered once for each ``template_name``,
+    ``form_class`` and active language, with a plain ``Context`` holding
+    only ``form`` and ``csrf_token``, and cached for
+    ``INVITATION_REGISTRATION_FORM_CACHE_TTL`` seconds. Email and CSRF
+    token are substituted into the cached rendering for each request.
+    """
+    cache_key = registration_form_cache_key(template_name, form_class)
+    content = cache.get(cache_key)
+    if content is None:
+        content = render_to_string(template_name, {
+                                      'form': form_class(EMAIL_PLACEHOLDER),
+                                      'csrf_token': CSRF_TOKEN_PLACEHOLDER,
+                                  }, context_instance=Context())
+        cache.set(cache_key, content,
+                  app_settings.REGISTRATION_FORM_CACHE_TTL)
+    content = content.replace(EMAIL_PLACEHOLDER, escape(email))
+    content = content.replace(CSRF_TOKEN_PLACEHOLDER, get_token(request))
+    return HttpResponse(content)
+
+
+def encode_cursor(invitation):
+    """
+    Return a page cursor pointing after ``invitation`` dictionary.
+    """
+    return '%s-%s' % (invitation['date_invited'].strftime(CURSOR_DATE_FORMAT),
+                      invitation['id'])
+
+
+def decode_cursor(cursor):
+    """
+    Return ``(date_invited, id)`` tuple for ``cursor``. Raise ``Http404`` if
+    the cursor is malformed.
+    """
+    try:
+        date_invited, pk = cursor.split('-', 1)
+        return (datetime.datetime.strptime(date_invited, CURSOR_DATE_FORMAT),
+                int(pk))
+    except ValueError:
+        raise Http404
+
+
+def sent_invitations_page(request, paginate_by):
+    """
+    Return a page of invitations sent by ``request.user`` and the cursor of
+    the next page, or ``None`` if it is the last page.
+    """
+    cursor = request.GET.get('after')
+    after = cursor and decode_cursor(cursor) or None
+    invitations = Invitation.objects.sent_by(request.user,
+                                             after,
+                                             paginate_by + 1)
+    next_cursor = None
+    if len(invitations) > paginate_by:
+        invitations = invitations[:paginate_by]
+        next_cursor = encode_cursor(invitations[-1])
+    return invitations, next_cursor
+
+
+def invite_only_redirect(request):
+    """Redirect to named URL ``invitation_invite_only``.
+    """
+    return HttpResponseRedirect(reverse('invitation_invite_only'))
+
+
+@transaction.commit_on_success
+def accept_invitation(invitation, form, request=None):
+    """
+    Create a new user from ``form`` and mark ``invitation`` accepted.
+    ``request`` is passed to ``Invitation.mark_accepted()`` for fraud
+    checks.
+
+    Both happen in one transaction. If the invitation can't be claimed,
+    because it is accepted concurrently for instance, ``InvitationError``
+    is raised and the new user is rolled back.
+    """
+    new_user = form.save()
+    invitation.mark_accepted(new_user, request)
+    return new_user
+
+
 @login_required
 def invite(request, success_url=None,
            form_class=InvitationForm,
@@ -28,7 +138,9 @@ def invite(request, success_url=None,
 
     Send invitation email and then redirect to success URL if the
     invitation form is valid. Redirect named URL ``invitation_unavailable``
-    on InvitationError. Render invitation form template otherwise.
+    on InvitationError. Render invitation form template otherwise. No email
+    is sent if the address already has an outstanding invitation from
+    another user (see ``INVITATION_GLOBAL_DEDUP``).
 
     **Required arguments:**
 
@@ -72,10 +184,15 @@ def invite(request, success_url=None,
         if form.is_valid():
             try:
                 invitation = Invitation.objects.invite(
-                                     request.user, form.cleaned_data["email"])
+                                     request.user,
+                                     form.cleaned_data["email"],
+                                     ip=get_ip(request))
             except InvitationError:
                 return HttpResponseRedirect(reverse('invitation_unavailable'))
-            invitation.send_email(request=request)
+            # With INVITATION_GLOBAL_DEDUP the address may already have an
+            # outstanding invitation from another user, don't mail it again.
+            if invitation.user_id == request.user.id:
+                invitation.send_email(request=request)
             return HttpResponseRedirect(success_url or \
                                                reverse('invitation_complete'))
     else:
@@ -102,6 +219,11 @@ def register(request,
     on InvitationError. Render invitation form template otherwise. Sends
     registration.signals.user_registered after creating the user.
 
+    The user is created and the invitation is claimed in a single
+    transaction, so concurrent submissions with the same key can't create
+    more than one user. Submissions that lose the race get the *wrong key
+    template*.
+
     **Required arguments:**
 
     :invitation_key:
@@ -153,9 +275,23 @@ def register(request,
     For main template
         :form:
             The registration form.
+
+    If ``INVITATION_REGISTRATION_FORM_CACHE_TTL`` is set and no
+    ``extra_context`` is given, the main template is rendered for ``GET``
+    requests from a cache, without a ``RequestContext``. Only ``form`` and
+    ``csrf_token`` are available to the template in this case, see
+    ``render_cached_form``.
     """
     if request.user.is_authenticated():
         return HttpResponseRedirect(redirect_to_if_authenticated)
+    if request.method != 'POST' and extra_context is None and \
+       app_settings.REGISTRATION_FORM_CACHE_TTL:
+        data = Invitation.objects.lookup(invitation_key)
+        if data is not None:
+            return render_cached_form(request,
+                                      template_name,
+                                      form_class,
+                                      data['email'])
     try:
         invitation = Invitation.objects.find(invitation_key)
     except Invitation.DoesNotExist:
@@ -166,8 +302,14 @@ def register(request,
     if request.method == 'POST':
         form = form_class(invitation.email, request.POST, request.FILES)
         if form.is_valid():
-            new_user = form.save()
-            invitation.mark_accepted(new_user)
+            try:
+                new_user = accept_invitation(invitation, form, request)
+            except InvitationError:
+                context = apply_extra_context(RequestContext(request),
+                                              extra_context)
+                return render_to_response(wrong_key_template,
+                                          {'invitation_key': invitation_key},
+                                          context_instance=context)
             user_registered.send(sender="invitation",
                                  user=new_user,
                                  request=request)
@@ -181,6 +323,65 @@ def register(request,
                               context_instance=context)
 
 
+@login_required
+def sent_invitations(request,
+                     paginate_by=20,
+                     template_name='invitation/invitation_list.html',
+                     extra_context=None):
+    """
+    List invitations sent by the current user, newest first.
+
+    Pages are addressed by the ``after`` GET parameter, a cursor pointing
+    the last invitation of the previous page, rather than a page number.
+
+    **Optional arguments:**
+
+    :paginate_by:
+        Number of invitations per page. Default value is ``20``.
+
+    :template_name:
+        A custom template to use. Default value is
+        ``invitation/invitation_list.html``.
+
+    :extra_context:
+        A dictionary of variables to add to the template context. Any
+        callable object in this dictionary will be called to produce
+        the end result which appears in the context.
+
+    **Context:**
+
+    :invitations:
+        List of dictionaries with ``id``, ``email``, ``key`` and
+        ``date_invited`` keys.
+
+    :next_cursor:
+        Value of ``after`` parameter for the next page, ``None`` if this
+        is the last page.
+    """
+    invitations, next_cursor = sent_invitations_page(request, paginate_by)
+    context = apply_extra_context(RequestContext(request), extra_context)
+    return render_to_response(template_name,
+                              {'invitations': invitations,
+                               'next_cursor': next_cursor},
+                              context_instance=context)
+
+
+@login_required
+def sent_invitations_json(request, paginate_by=20):
+    """
+    JSON version of ``sent_invitations``.
+
+    Response is an object with ``invitations`` and ``next_cursor`` keys.
+    """
+    invitations, next_cursor = sent_invitations_page(request, paginate_by)
+    for invitation in invitations:
+        del invitation['key']
+    data = {'invitations': invitations, 'next_cursor': next_cursor}
+    return HttpResponse(simplejson.dumps(data, cls=DjangoJSONEncoder),
+                        mimetype='application/json')
+
+
+@invite_only_required
 @staff_member_required
 def reward(request):
     """
@@ -198,3 +399,21 @@ def reward(request):
                            u'threshold, no invitations awarded.')
     request.user.message_set.create(message=message)
     return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/'))
+
+
+@staff_member_required
+def dashboard(request, template_name='admin/invitation/dashboard.html'):
+    """
+    Display cached invitation figures for staff.
+
+    **Context:**
+
+    :dashboard:
+        Dictionary returned by ``invitation.dashboard.get_dashboard()``,
+        ``None`` if ``refresh_invitation_dashboard`` command hasn't
+        calculated the figures yet.
+    """
+    return render_to_response(template_name,
+                              {'dashboard': get_dashboard(),
+                               'title': ugettext(u'Invitation dashboard')},
+                              context_instance=RequestContext(request))
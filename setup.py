@@ -33,13 +33,18 @@ setup(
     author_email = __email__,
     license = license_text,
     packages = ['invitation',
+                'invitation.management',
+                'invitation.management.commands',
                 'invitation.tests',
                 'invitation.templatetags'],
     package_data= {
-        'invitation': ['templates/admin/invitation/invitationstats/*',
+        'invitation': ['templates/admin/invitation/*.html',
+                       'templates/admin/invitation/invitationstats/*',
+                       'tests/templates/*.html',
                        'tests/templates/invitations/*',
                        'tests/templates/registration/*',
-                       'locale/*/LC_MESSAGES/django.*']
+                       'locale/*/LC_MESSAGES/django.*',
+                       'sql/*.sql']
     },
     data_files=[('', ['LICENSE.txt',
                       'README.rst'])],